@@ -10,7 +10,6 @@ from django.contrib.auth import password_validation
 from django.template.loader import render_to_string
 
 from .models import User
-from .otp_utils import EmailThread
 from .validators import validate_name
 
 
@@ -1,17 +1,8 @@
 import random
-import threading
-from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
+from apps.common.emails import queue_email
 from .models import Otp  
 
-class EmailThread(threading.Thread):
-    def __init__(self, email):
-        self.email = email
-        threading.Thread.__init__(self)
-
-    def run(self):
-        self.email.send()
-
 class OTPService:
     @staticmethod
     def generate_otp():
@@ -36,9 +27,7 @@ class OTPService:
             "otp": otp,
         }
         message = render_to_string("accounts/emails/email_verification_code.html", context)
-        email_message = EmailMessage(subject=subject, body=message, to=[user.email])
-        email_message.content_subtype = "html"
-        EmailThread(email_message).start()
+        queue_email(subject, message, [user.email])
         
     @staticmethod
     def welcome(request, user):
@@ -49,9 +38,7 @@ class OTPService:
             "name": user.full_name,
         }
         message = render_to_string("accounts/emails/welcome_message.html", context)
-        email_message = EmailMessage(subject=subject, body=message, to=[user.email])
-        email_message.content_subtype = "html"
-        EmailThread(email_message).start()
+        queue_email(subject, message, [user.email])
         
     @staticmethod
     def send_password_reset_otp(request, user):
@@ -66,9 +53,7 @@ class OTPService:
             "otp": otp,
         }
         message = render_to_string("accounts/emails/password_reset_html_email.html", context)
-        email_message = EmailMessage(subject=subject, body=message, to=[email])
-        email_message.content_subtype = "html"
-        EmailThread(email_message).start()
+        queue_email(subject, message, [email])
 
     @staticmethod
     def password_reset_success(request, user):
@@ -79,9 +64,7 @@ class OTPService:
             "name": user.full_name,
         }
         message = render_to_string("accounts/password_reset_success.html", context)
-        email_message = EmailMessage(subject=subject, body=message, to=[user.email])
-        email_message.content_subtype = "html"
-        EmailThread(email_message).start()
+        queue_email(subject, message, [user.email])
 
 
 
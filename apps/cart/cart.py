@@ -1,51 +1,161 @@
 from decimal import Decimal
 from django.conf import settings
+from apps.common.redis_client import get_redis
 from apps.coupons.models import Coupon
 from apps.shop.models import Product
-import redis
-import json
+
+
+# Set (or with a quantity <= 0, remove) one cart line atomically and keep
+# the cart's item count next to it.
+# KEYS[1] quantities hash, KEYS[2] prices hash, KEYS[3] item count
+# ARGV[1] product id, ARGV[2] quantity, ARGV[3] unit price, ARGV[4] ttl (0 = none),
+# ARGV[5] "1" to add the quantity to the current one instead of replacing it
+UPDATE_LINE_SCRIPT = """
+local quantity = tonumber(ARGV[2])
+if ARGV[5] == '1' then
+    quantity = quantity + tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or 0)
+end
+if quantity <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+else
+    redis.call('HSET', KEYS[1], ARGV[1], quantity)
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+end
+local count = 0
+for _, value in ipairs(redis.call('HVALS', KEYS[1])) do
+    count = count + tonumber(value)
+end
+if count > 0 then
+    redis.call('SET', KEYS[3], count)
+else
+    redis.call('DEL', KEYS[3])
+end
+local ttl = tonumber(ARGV[4])
+if ttl > 0 and count > 0 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+    redis.call('EXPIRE', KEYS[2], ttl)
+    redis.call('EXPIRE', KEYS[3], ttl)
+end
+return quantity
+"""
+
+_update_line = None
+
+
+def get_update_line_script():
+    """Register the line script once per process; redis-py caches its SHA."""
+    global _update_line
+    if _update_line is None:
+        _update_line = get_redis().register_script(UPDATE_LINE_SCRIPT)
+    return _update_line
+
+# set while the session knows the user's cart is empty, so rendering the
+# cart badge needs no Redis; cart writes in this session keep it current
+CART_EMPTY_SESSION_KEY = "cart_empty"
+
+# product fields read by the cart, checkout and recommendation code
+PRODUCT_FIELDS = ("id", "name", "slug", "price", "image")
+
+
+def get_cart_keys(user_id=None, session_key=None):
+    """
+    Redis keys for a cart: a hash of product id -> quantity, a hash of
+    product id -> unit price at the time it was added and the total
+    number of items, which expire together.
+    """
+    key = f"cart:{user_id}" if user_id else f"cart:guest:{session_key}"
+    return key, f"{key}:prices", f"{key}:count"
 
 
 class Cart:
 
     def __init__(self, request):
         """
-        Initialize the cart.
+        Initialize the cart. No Redis I/O happens until the cart
+        contents are actually used.
         """
+        self.session = request.session
 
-        # Connect to Redis
-        self.redis_client = redis.StrictRedis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            db=settings.REDIS_DB,
-            decode_responses=True,  # Ensures data is stored as strings
-        )
+        # Borrow a connection from the shared Redis pool (connects lazily)
+        self.redis_client = get_redis()
+
+        self.is_guest = not request.user.is_authenticated
+        if not self.is_guest:
+            self.cart_key, self.price_key, self.count_key = get_cart_keys(
+                user_id=request.user.id
+            )
+            self.ttl = 0  # carts of signed in users don't expire
+        else:
+            self._set_guest_keys()
+            self.ttl = settings.CART_GUEST_TTL
+
+        self._cart = None
+        self._items = None
 
-        # Create a unique key for the cart
-        # self.cart_key = (
-        #     f"cart_{request.user.id}" if request.user.is_authenticated else None
-        # )
-        self.cart_key = (
-            f"cart_{request.user.id}"
-            if request.user.is_authenticated
-            else f"cart_guest_{request.session.session_key}"
+        # store current applied coupon
+        self.coupon_id = request.session.get("coupon_id")
+        self._coupon = None
+
+    def _set_guest_keys(self):
+        self.cart_key, self.price_key, self.count_key = get_cart_keys(
+            session_key=self.session.session_key
         )
 
-        # Try to get the cart from Redis
-        cart = self.redis_client.get(self.cart_key)
+    @property
+    def is_persistent(self):
+        """Visitors without a session have nowhere to keep a cart."""
+        return not self.is_guest or bool(self.session.session_key)
+
+    @property
+    def cart(self):
+        if self._cart is None:
+            self._cart = self._load() if self.is_persistent else {}
+            if not self.is_guest:
+                self._remember_count(len(self))
+        return self._cart
+
+    def _load(self):
+        # Load both hashes in one round trip
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hgetall(self.cart_key)
+        pipe.hgetall(self.price_key)
+        quantities, prices = pipe.execute()
+
+        return {
+            product_id: {"quantity": int(quantity), "price": prices.get(product_id, "0")}
+            for product_id, quantity in quantities.items()
+        }
 
-        if cart:
-            # Load the cart from Redis if it exists
-            self.cart = json.loads(cart)
+    def count(self):
+        """
+        Number of items in the cart, read from the counter stored next to
+        the cart so that the badge is right on every device without
+        loading the whole cart. Anonymous visitors have no cart, and a
+        session that saw the cart empty skips Redis until the cart changes.
+        """
+        if self.is_guest:
+            return 0
+        if self._cart is not None:
+            count = len(self)
+        elif self.session.get(CART_EMPTY_SESSION_KEY):
+            return 0
         else:
-            # Create an empty cart if not found
-            self.cart = {}
-            self.redis_client.set(
-                self.cart_key, json.dumps(self.cart)
-            )  # Save the empty cart in Redis
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.get(self.count_key)
+            pipe.exists(self.cart_key)
+            count, exists = pipe.execute()
+            # a cart written before the counter existed has none yet
+            count = len(self) if count is None and exists else int(count or 0)
+        self._remember_count(count)
+        return count
 
-        # store current applied coupon
-        self.coupon_id = request.session.get("coupon_id")
+    def _remember_count(self, count):
+        # only touch the session when the marker changes
+        if count and self.session.get(CART_EMPTY_SESSION_KEY):
+            del self.session[CART_EMPTY_SESSION_KEY]
+        elif not count and not self.session.get(CART_EMPTY_SESSION_KEY):
+            self.session[CART_EMPTY_SESSION_KEY] = True
 
     def add(self, product, quantity=1, override_quantity=False):
         """
@@ -53,47 +163,86 @@ class Cart:
         """
         # Convert product ID to string (Redis requires string keys)
         product_id = str(product.id)
+        price = str(product.price)
 
-        if product_id not in self.cart:
-            self.cart[product_id] = {"quantity": 0, "price": str(product.price)}
-
-        if override_quantity:
-            self.cart[product_id]["quantity"] = quantity
-        else:
-            self.cart[product_id]["quantity"] += quantity
+        if not self.is_persistent:
+            # first cart write for this visitor, give them a session
+            self.session.save()
+            self._set_guest_keys()
 
-        self.save()
+        quantity = self._set_line(
+            product_id, quantity, price, increment=not override_quantity
+        )
 
-    def save(self):
-        """
-        Save the cart to Redis.
-        """
-        self.redis_client.set(self.cart_key, json.dumps(self.cart))
+        if quantity > 0:
+            self.cart[product_id] = {"quantity": quantity, "price": price}
+        else:
+            self.cart.pop(product_id, None)
+        self._items = None
+        self._remember_count(len(self))
 
     def remove(self, product):
         """
         Remove a product from the cart.
         """
         product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
-            self.save()
+        if product_id not in self.cart:
+            return
+        self._set_line(product_id, 0)
+        self.cart.pop(product_id, None)
+        self._items = None
+        self._remember_count(len(self))
 
-    def __iter__(self):
+    def _set_line(self, product_id, quantity, price="", increment=False):
+        return get_update_line_script()(
+            keys=[self.cart_key, self.price_key, self.count_key],
+            args=[product_id, quantity, price, self.ttl, int(increment)],
+            client=self.redis_client,
+        )
+
+    def _snapshot(self):
         """
-        Iterate over the items in the cart and get the products
-        from the database.
+        Hydrate products and compute line totals, subtotal, discount and
+        grand total in one pass. Memoized until the cart changes.
         """
-        product_ids = self.cart.keys()
-        # get the product objects and add them to the cart
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
-        for product in products:
-            cart[str(product.id)]["product"] = product
-        for item in cart.values():
+        if self._items is not None:
+            return self._items
+
+        products = Product.objects.filter(id__in=self.cart.keys()).only(
+            *PRODUCT_FIELDS
+        )
+        products = {str(product.id): product for product in products}
+
+        items = []
+        subtotal = Decimal(0)
+        for product_id, item in self.cart.items():
+            product = products.get(product_id)
+            if product is None:  # product was deleted since it was added
+                continue
+            item["product"] = product
             item["price"] = Decimal(item["price"])
             item["total_price"] = item["price"] * item["quantity"]
-            yield item
+            subtotal += item["total_price"]
+            items.append(item)
+
+        discount = Decimal(0)
+        if self.coupon:
+            discount = (self.coupon.discount / Decimal(100)) * subtotal
+
+        self._items = items
+        self._totals = {
+            "subtotal": subtotal,
+            "discount": discount,
+            "total": subtotal - discount,
+        }
+        return self._items
+
+    def __iter__(self):
+        """
+        Iterate over the items in the cart with their products
+        loaded from the database once per cart.
+        """
+        return iter(self._snapshot())
 
     def __len__(self):
         """
@@ -102,31 +251,33 @@ class Cart:
         return sum(item["quantity"] for item in self.cart.values())
 
     def get_total_price(self):
-        return sum(
-            Decimal(item["price"]) * item["quantity"] for item in self.cart.values()
-        )
+        self._snapshot()
+        return self._totals["subtotal"]
 
     def clear(self):
         """
         Clear the cart in Redis.
         """
-        self.cart = {}  # Reset the cart in memory
-        self.redis_client.delete(self.cart_key)
+        self._cart = {}  # Reset the cart in memory
+        self._items = None
+        self._remember_count(0)
+        self.redis_client.delete(self.cart_key, self.price_key, self.count_key)
 
     @property
     def coupon(self):
-        if self.coupon_id:
-            try:
-                return Coupon.objects.get(id=self.coupon_id)
-            except Coupon.DoesNotExist:
-                pass
-        return None
+        if self._coupon is None:
+            self._coupon = False
+            if self.coupon_id:
+                try:
+                    self._coupon = Coupon.objects.get(id=self.coupon_id)
+                except Coupon.DoesNotExist:
+                    pass
+        return self._coupon or None
 
     def get_discount(self):
-        if self.coupon:
-            return (self.coupon.discount / Decimal(100)) * self.get_total_price()
-
-        return Decimal(0)
+        self._snapshot()
+        return self._totals["discount"]
 
     def get_total_price_after_discount(self):
-        return self.get_total_price() - self.get_discount()
+        self._snapshot()
+        return self._totals["total"]
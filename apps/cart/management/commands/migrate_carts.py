@@ -0,0 +1,68 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.cart.cart import get_cart_keys
+from apps.common.redis_client import get_redis
+
+GUEST_PREFIX = "cart_guest_"
+USER_PREFIX = "cart_"
+
+
+class Command(BaseCommand):
+    help = 'Convert JSON blob carts ("cart_<id>" strings) into per-line Redis hashes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        r = get_redis()
+        migrated = skipped = 0
+
+        for old_key in r.scan_iter(match=f"{USER_PREFIX}*", count=500):
+            if r.type(old_key) != "string":
+                continue
+
+            if old_key.startswith(GUEST_PREFIX):
+                session_key = old_key[len(GUEST_PREFIX):]
+                if session_key == "None":  # shared key of visitors without a session
+                    skipped += 1
+                    if not options['dry_run']:
+                        r.delete(old_key)
+                    continue
+                cart_key, price_key, count_key = get_cart_keys(session_key=session_key)
+                ttl = settings.CART_GUEST_TTL
+            else:
+                cart_key, price_key, count_key = get_cart_keys(user_id=old_key[len(USER_PREFIX):])
+                ttl = 0
+
+            try:
+                cart = json.loads(r.get(old_key) or "{}")
+            except json.JSONDecodeError:
+                self.stderr.write(f'Skipping unreadable cart {old_key}')
+                skipped += 1
+                continue
+
+            if options['dry_run']:
+                migrated += 1
+                continue
+
+            pipe = r.pipeline()
+            count = 0
+            for product_id, item in cart.items():
+                if item.get("quantity", 0) > 0:
+                    pipe.hincrby(cart_key, product_id, item["quantity"])
+                    pipe.hset(price_key, product_id, item["price"])
+                    count += item["quantity"]
+            if count:
+                pipe.incrby(count_key, count)
+            if ttl and count:
+                pipe.expire(cart_key, ttl)
+                pipe.expire(price_key, ttl)
+                pipe.expire(count_key, ttl)
+            pipe.delete(old_key)
+            pipe.execute()
+            migrated += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Migrated {migrated} carts, skipped {skipped}'))
@@ -1,13 +1,15 @@
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.test import Client
 from django.urls import reverse
-from apps.common.utils import TestUtil
+from apps.common.utils import RedisTestCase, TestUtil
 from apps.shop.models import Product
 from apps.cart.cart import Cart
 from django.http import JsonResponse
 
+from unittest.mock import patch
 
-class CartViewsTestCase(TestCase):
+
+class CartViewsTestCase(RedisTestCase):
     def setUp(self):
         self.client = Client()
         self.user = TestUtil.verified_user()
@@ -52,3 +54,57 @@ class CartViewsTestCase(TestCase):
         response = self.client.get(self.cart_url)
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "cart/cart_detail.html")
+
+    def test_cart_quantity_updates(self):
+        self.client.post(self.add_url, {"quantity": 2, "override": False})
+        self.client.post(self.add_url, {"quantity": 3, "override": False})
+        response = self.client.get(self.cart_url)
+        cart = response.context["cart"]
+        self.assertEqual(len(cart), 5)
+
+        self.client.post(self.add_url, {"quantity": 1, "override": True})
+        response = self.client.get(self.cart_url)
+        cart = response.context["cart"]
+        self.assertEqual(len(cart), 1)
+        self.assertEqual(cart.get_total_price(), self.product.price)
+
+        self.client.delete(self.remove_url)
+        response = self.client.get(self.cart_url)
+        self.assertEqual(len(response.context["cart"]), 0)
+
+    def test_cart_count_is_shared_across_sessions(self):
+        self.client.post(self.add_url, {"quantity": 2, "override": False})
+
+        other_device = Client()
+        other_device.force_login(self.user)
+        other_device.post(self.add_url, {"quantity": 1, "override": False})
+
+        with patch.object(Cart, "_load") as mock_load:
+            response = self.client.get(reverse("shop:home"))
+            self.assertEqual(response.context["cart_length"], 3)
+            mock_load.assert_not_called()
+
+    def test_empty_cart_count_needs_no_redis(self):
+        self.client.get(reverse("shop:home"))
+
+        with patch("apps.cart.cart.get_redis") as mock_redis:
+            response = self.client.get(reverse("shop:home"))
+            self.assertEqual(response.context["cart_length"], 0)
+            self.client.logout()
+            self.client.get(reverse("shop:home"))
+        mock_redis.return_value.pipeline.assert_not_called()
+
+        self.client.force_login(self.user)
+        self.client.post(self.add_url, {"quantity": 1, "override": False})
+        response = self.client.get(reverse("shop:home"))
+        self.assertEqual(response.context["cart_length"], 1)
+
+    def test_cart_detail_hydrates_products_once(self):
+        self.client.post(self.add_url, {"quantity": 2, "override": False})
+        response = self.client.get(self.cart_url)
+        cart = response.context["cart"]
+
+        with self.assertNumQueries(0):
+            items = list(cart)
+            cart.get_total_price_after_discount()
+        self.assertEqual(items[0]["total_price"], self.product.price * 2)
@@ -31,15 +31,16 @@ class CartRemove(LoginRequiredMixin, View):
         cart.remove(product)
         
         # Prepare the context for the partial template
+        cart_products = []
         for item in cart:
             item["update_quantity_form"] = CartAddProductForm(
                 initial={"quantity": item["quantity"], "override": True}
             )
+            cart_products.append(item["product"])
             
         coupon_apply_form = CouponApplyForm()
 
         r = Recommender()
-        cart_products = [item["product"] for item in cart]
         if cart_products:
             recommended_products = r.suggest_products_for(cart_products, max_results=4)
         else:
@@ -62,15 +63,16 @@ class CartRemove(LoginRequiredMixin, View):
 class CartDetail(LoginRequiredMixin, View):
     def get(self, request):
         cart = Cart(request)
+        cart_products = []
         for item in cart:
             item["update_quantity_form"] = CartAddProductForm(
                 initial={"quantity": item["quantity"], "override": True}
             )
+            cart_products.append(item["product"])
 
         coupon_apply_form = CouponApplyForm()
 
         r = Recommender()
-        cart_products = [item["product"] for item in cart]
         if cart_products:
             recommended_products = r.suggest_products_for(cart_products, max_results=4)
         else:
@@ -0,0 +1,16 @@
+from django.core.cache.backends.redis import RedisCache, RedisCacheClient
+
+from apps.common.redis_client import get_pool
+
+
+class PooledRedisCacheClient(RedisCacheClient):
+    def _get_connection_pool(self, write):
+        return get_pool(decode_responses=False)
+
+
+class PooledRedisCache(RedisCache):
+    """Django's RedisCache, borrowing connections from apps.common.redis_client."""
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self._class = PooledRedisCacheClient
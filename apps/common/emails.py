@@ -0,0 +1,155 @@
+import base64
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from redis.exceptions import LockError
+
+from apps.common.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+EMAIL_OUTBOX_KEY = "email:outbox"
+EMAIL_OUTBOX_SCHEDULED_KEY = "email:outbox:scheduled"
+# mails being sent, moved back to the outbox if their worker died
+EMAIL_PROCESSING_KEY = "email:outbox:processing"
+# failed sends per mail id, and the mails that failed EMAIL_MAX_ATTEMPTS times
+EMAIL_ATTEMPTS_KEY = "email:outbox:attempts"
+EMAIL_DEAD_LETTER_KEY = "email:outbox:dead"
+# one worker drains the outbox at a time
+EMAIL_OUTBOX_LOCK_KEY = "email:outbox:lock"
+EMAIL_OUTBOX_LOCK_TIMEOUT = 300
+
+
+def queue_email(subject, body, to, attachments=()):
+    """
+    Add an HTML email to the outbox and schedule one send for everything
+    queued within EMAIL_BATCH_DELAY seconds. `attachments` holds
+    (filename, content bytes, mimetype) tuples. Returns at once: the
+    message sits in Redis until a worker sends it, even across restarts.
+    """
+    from apps.common.tasks import send_queued_emails
+
+    payload = {
+        "id": uuid.uuid4().hex,
+        "subject": subject,
+        "body": body,
+        "to": list(to),
+        "attachments": [
+            (filename, base64.b64encode(content).decode(), mimetype)
+            for filename, content, mimetype in attachments
+        ],
+    }
+    r = get_redis()
+    r.rpush(EMAIL_OUTBOX_KEY, json.dumps(payload))
+    delay = settings.EMAIL_BATCH_DELAY
+    if r.set(EMAIL_OUTBOX_SCHEDULED_KEY, 1, nx=True, ex=delay + 60):
+        try:
+            send_queued_emails.apply_async(countdown=delay, retry=False)
+        except Exception:
+            # the mail stays in the outbox and goes out with the next send
+            r.delete(EMAIL_OUTBOX_SCHEDULED_KEY)
+            logger.warning("could not schedule email send", exc_info=True)
+
+
+def build_email(payload, connection):
+    message = EmailMessage(
+        subject=payload["subject"],
+        body=payload["body"],
+        to=payload["to"],
+        connection=connection,
+    )
+    message.content_subtype = "html"
+    for filename, content, mimetype in payload["attachments"]:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+def email_id(raw):
+    return json.loads(raw)["id"]
+
+
+def fail_email(r, raw):
+    """
+    Count a failed attempt of the mail and move it from the processing list
+    to the back of the outbox, so it doesn't hold up the mails behind it,
+    or to the dead letter list once it failed EMAIL_MAX_ATTEMPTS times.
+    """
+    attempt = r.hincrby(EMAIL_ATTEMPTS_KEY, email_id(raw), 1)
+    pipe = r.pipeline()
+    pipe.lrem(EMAIL_PROCESSING_KEY, 1, raw)
+    if attempt >= settings.EMAIL_MAX_ATTEMPTS:
+        logger.error("giving up on email %s after %s attempts", email_id(raw), attempt)
+        pipe.rpush(EMAIL_DEAD_LETTER_KEY, raw)
+        pipe.hdel(EMAIL_ATTEMPTS_KEY, email_id(raw))
+    else:
+        pipe.rpush(EMAIL_OUTBOX_KEY, raw)
+    pipe.execute()
+
+
+def return_emails(r, batch):
+    """Move unsent mails from the processing list back to the head of the outbox, in order."""
+    if not batch:
+        return
+    pipe = r.pipeline()
+    for raw in reversed(batch):
+        pipe.lrem(EMAIL_PROCESSING_KEY, 1, raw)
+        pipe.lpush(EMAIL_OUTBOX_KEY, raw)
+    pipe.execute()
+
+
+def send_email_outbox(batch_size=None):
+    """
+    Drain the outbox over a single SMTP connection. Mails are taken in
+    batches into a processing list and each one is removed as soon as it
+    is sent, so the mails of a worker that died are sent by the next run.
+    Only the mail that failed is charged an attempt: it goes to the back
+    of the outbox (or to the dead letter list), the unsent rest of its
+    batch back to the head, and the error is raised for the retry.
+    Returns the number sent, or None when another worker is draining.
+    """
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    r = get_redis()
+    lock = r.lock(EMAIL_OUTBOX_LOCK_KEY, timeout=EMAIL_OUTBOX_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        return None
+    try:
+        # mails queued from now on schedule a new send
+        r.delete(EMAIL_OUTBOX_SCHEDULED_KEY)
+        stranded = r.lrange(EMAIL_PROCESSING_KEY, 0, -1)
+        if stranded:
+            # the first one was being sent when its worker died
+            fail_email(r, stranded[0])
+            return_emails(r, stranded[1:])
+
+        sent = 0
+        with get_connection(fail_silently=False) as connection:
+            while True:
+                lock.reacquire()
+                pipe = r.pipeline()
+                for _ in range(batch_size):
+                    pipe.lmove(EMAIL_OUTBOX_KEY, EMAIL_PROCESSING_KEY, "LEFT", "RIGHT")
+                batch = [raw for raw in pipe.execute() if raw is not None]
+                if not batch:
+                    break
+                for i, raw in enumerate(batch):
+                    try:
+                        connection.send_messages([build_email(json.loads(raw), connection)])
+                    except Exception:
+                        fail_email(r, raw)
+                        return_emails(r, batch[i + 1:])
+                        raise
+                    pipe = r.pipeline()
+                    pipe.lrem(EMAIL_PROCESSING_KEY, 1, raw)
+                    pipe.hdel(EMAIL_ATTEMPTS_KEY, email_id(raw))
+                    pipe.execute()
+                    sent += 1
+        return sent
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # expired while sending, another worker may hold it by now
+            pass
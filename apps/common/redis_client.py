@@ -0,0 +1,90 @@
+import threading
+
+import redis
+from django.conf import settings
+
+_pools = {}
+_lock = threading.Lock()
+
+
+class TrackedConnectionPool(redis.BlockingConnectionPool):
+    """
+    BlockingConnectionPool that counts its connections through the public
+    pool API, so pool_stats() doesn't depend on redis-py internals.
+    """
+
+    def reset(self):
+        # also called by redis-py after a fork, the counts start over with it
+        self._stats_lock = threading.Lock()
+        self.connections_created = 0
+        self.connections_in_use = 0
+        super().reset()
+
+    def make_connection(self):
+        connection = super().make_connection()
+        with self._stats_lock:
+            self.connections_created += 1
+        return connection
+
+    def get_connection(self, *args, **kwargs):
+        connection = super().get_connection(*args, **kwargs)
+        with self._stats_lock:
+            self.connections_in_use += 1
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        with self._stats_lock:
+            self.connections_in_use = max(self.connections_in_use - 1, 0)
+
+
+def get_pool(decode_responses=True):
+    """
+    Return the process-wide Redis connection pool, creating it on first use.
+    redis-py resets the pool itself when a gunicorn/celery worker forks.
+    The Django cache stores pickled bytes, so it uses a second, undecoded pool.
+    """
+    pool = _pools.get(decode_responses)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(decode_responses)
+            if pool is None:
+                pool = _pools[decode_responses] = TrackedConnectionPool(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    max_connections=settings.REDIS_MAX_CONNECTIONS,
+                    timeout=settings.REDIS_POOL_TIMEOUT,
+                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    health_check_interval=30,
+                    decode_responses=decode_responses,
+                )
+    return pool
+
+
+def get_redis():
+    """Return a client bound to the shared pool. Clients are cheap to create."""
+    return redis.Redis(connection_pool=get_pool())
+
+
+def pool_stats(decode_responses=True):
+    """Report how many pooled connections exist and how many are checked out."""
+    pool = get_pool(decode_responses)
+    created = pool.connections_created
+    in_use = min(pool.connections_in_use, created)
+    return {
+        "max_connections": pool.max_connections,
+        "created": created,
+        "in_use": in_use,
+        "idle": created - in_use,
+        "saturation": round(in_use / pool.max_connections, 2),
+    }
+
+
+def close_pools():
+    """Disconnect and forget the pools, they are recreated from settings on next use."""
+    with _lock:
+        for pool in _pools.values():
+            pool.disconnect()
+        _pools.clear()
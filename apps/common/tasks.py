@@ -0,0 +1,26 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=5)
+def send_queued_emails(self):
+    """
+    Task to send the mails waiting in the email outbox, retried with
+    exponential backoff while the SMTP server is unavailable.
+    """
+    from apps.common.emails import send_email_outbox
+
+    try:
+        sent = send_email_outbox()
+    except Exception as e:
+        raise self.retry(exc=e, countdown=30 * 2**self.request.retries)
+    if sent is None:
+        # another worker is draining the outbox, look again once it is done
+        self.apply_async(countdown=settings.EMAIL_BATCH_DELAY, retry=False)
+        return {"sent": 0}
+    logger.info("email outbox: %s sent", sent)
+    return {"sent": sent}
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from apps.common.redis_client import close_pools, get_redis
+
+
+class RedisTestRunner(DiscoverRunner):
+    """
+    Run the suite against REDIS_TEST_DB instead of the development Redis
+    database, emptying it before and after the run. RedisTestCase also
+    empties it around every test.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._redis_settings = override_settings(REDIS_DB=settings.REDIS_TEST_DB)
+        self._redis_settings.enable()
+        close_pools()
+        get_redis().flushdb()
+
+    def teardown_test_environment(self, **kwargs):
+        get_redis().flushdb()
+        self._redis_settings.disable()
+        close_pools()
+        super().teardown_test_environment(**kwargs)
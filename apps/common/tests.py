@@ -1,3 +1,133 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import override_settings
+from django.urls import reverse
+from redis.exceptions import ConnectionError
+
+from apps.common.emails import (
+    EMAIL_DEAD_LETTER_KEY,
+    EMAIL_OUTBOX_KEY,
+    EMAIL_PROCESSING_KEY,
+    queue_email,
+    send_email_outbox,
+)
+from apps.common.redis_client import get_redis
+from apps.common.utils import RedisTestCase, TestUtil
+
+from unittest.mock import patch
+
+
+class RedisHealthViewTest(RedisTestCase):
+    def setUp(self):
+        self.url = reverse("common:redis_health")
+
+    @patch("redis.Redis.ping", return_value=True)
+    def test_redis_health_ok(self, mock_ping):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ok"})
+
+    @patch("redis.Redis.ping", return_value=True)
+    def test_redis_health_details_for_staff(self, mock_ping):
+        self.client.force_login(TestUtil.admin_user())
+        response = self.client.get(self.url)
+        self.assertIn("saturation", response.json()["pool"])
+
+    @patch("redis.Redis.ping", side_effect=ConnectionError("down"))
+    def test_redis_health_down(self, mock_ping):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {"status": "error"})
+
+
+class EmailOutboxTest(RedisTestCase):
+    @patch("apps.common.tasks.send_queued_emails.apply_async")
+    def test_mails_are_queued_and_sent_in_one_session(self, mock_schedule):
+        queue_email("First", "<p>1</p>", ["a@example.com"])
+        queue_email(
+            "Second",
+            "<p>2</p>",
+            ["b@example.com"],
+            attachments=[("invoice.pdf", b"%PDF", "application/pdf")],
+        )
+        # one send is scheduled for the whole burst
+        mock_schedule.assert_called_once()
+        self.assertEqual(mail.outbox, [])
+
+        with patch("apps.common.emails.get_connection", wraps=get_connection) as conn:
+            self.assertEqual(send_email_outbox(), 2)
+        conn.assert_called_once()
+        self.assertEqual([m.subject for m in mail.outbox], ["First", "Second"])
+        self.assertEqual(mail.outbox[1].attachments[0][1], b"%PDF")
+
+    @patch("apps.common.tasks.send_queued_emails.apply_async")
+    def test_unsent_mails_stay_in_the_outbox(self, mock_schedule):
+        for subject in ("First", "Second", "Third"):
+            queue_email(subject, "<p></p>", ["a@example.com"])
+
+        with patch.object(
+            EmailBackend, "send_messages", side_effect=ConnectionError("smtp down")
+        ):
+            with self.assertRaises(ConnectionError):
+                send_email_outbox()
+        self.assertEqual(get_redis().llen(EMAIL_OUTBOX_KEY), 3)
+        self.assertEqual(get_redis().llen(EMAIL_PROCESSING_KEY), 0)
+
+        # only the mail that failed lost its place
+        self.assertEqual(send_email_outbox(), 3)
+        self.assertEqual([m.subject for m in mail.outbox], ["Second", "Third", "First"])
+
+    @patch("apps.common.tasks.send_queued_emails.apply_async")
+    def test_mails_of_a_dead_worker_are_sent(self, mock_schedule):
+        queue_email("First", "<p></p>", ["a@example.com"])
+        queue_email("Second", "<p></p>", ["a@example.com"])
+        # a worker took the first mail and died before sending it
+        get_redis().lmove(EMAIL_OUTBOX_KEY, EMAIL_PROCESSING_KEY, "LEFT", "RIGHT")
+
+        self.assertEqual(send_email_outbox(), 2)
+        self.assertEqual([m.subject for m in mail.outbox], ["First", "Second"])
+        self.assertEqual(get_redis().llen(EMAIL_PROCESSING_KEY), 0)
+
+    @override_settings(EMAIL_MAX_ATTEMPTS=2)
+    @patch("apps.common.tasks.send_queued_emails.apply_async")
+    def test_failing_mails_are_moved_to_dead_letters(self, mock_schedule):
+        queue_email("Broken", "<p></p>", ["a@example.com"])
+
+        with patch.object(
+            EmailBackend, "send_messages", side_effect=ValueError("bad header")
+        ):
+            for _ in range(2):
+                with self.assertRaises(ValueError):
+                    send_email_outbox()
+        self.assertEqual(get_redis().llen(EMAIL_OUTBOX_KEY), 0)
+        self.assertEqual(get_redis().llen(EMAIL_DEAD_LETTER_KEY), 1)
+
+        queue_email("Next", "<p></p>", ["a@example.com"])
+        self.assertEqual(send_email_outbox(), 1)
+        self.assertEqual([m.subject for m in mail.outbox], ["Next"])
+
+    @override_settings(EMAIL_MAX_ATTEMPTS=2)
+    @patch("apps.common.tasks.send_queued_emails.apply_async")
+    def test_a_failing_mail_does_not_take_the_batch_down(self, mock_schedule):
+        for subject in ("First", "Broken", "Second", "Third"):
+            queue_email(subject, "<p></p>", ["a@example.com"])
+
+        send_messages = EmailBackend.send_messages
+
+        def refuse_broken(backend, messages):
+            if messages[0].subject == "Broken":
+                raise ValueError("bad header")
+            return send_messages(backend, messages)
+
+        with patch.object(EmailBackend, "send_messages", autospec=True, side_effect=refuse_broken):
+            for _ in range(2):
+                with self.assertRaises(ValueError):
+                    send_email_outbox()
+            self.assertEqual(send_email_outbox(), 0)
+
+        self.assertEqual([m.subject for m in mail.outbox], ["First", "Second", "Third"])
+        dead = get_redis().lrange(EMAIL_DEAD_LETTER_KEY, 0, -1)
+        self.assertEqual([json.loads(raw)["subject"] for raw in dead], ["Broken"])
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = "common"
+
+urlpatterns = [
+    path("health/redis/", views.redis_health, name="redis_health"),
+]
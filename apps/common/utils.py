@@ -1,6 +1,31 @@
+from django.conf import settings
+from django.test import TestCase
+
 from apps.accounts.models import User
+from apps.common.redis_client import get_redis
 from apps.shop.models import Category, Product
 
+
+class RedisTestCase(TestCase):
+    """
+    TestCase that also empties the test Redis database before and after
+    every test, since only the SQL database is rolled back.
+    """
+
+    def __call__(self, result=None):
+        self.flush_redis()
+        try:
+            return super().__call__(result)
+        finally:
+            self.flush_redis()
+
+    @staticmethod
+    def flush_redis():
+        if settings.REDIS_DB != settings.REDIS_TEST_DB:
+            raise RuntimeError("Run the tests with RedisTestRunner, not against REDIS_DB")
+        get_redis().flushdb()
+
+
 class TestUtil:
     def new_user():
         user_dict = {
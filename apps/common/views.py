@@ -1,3 +1,31 @@
-from django.shortcuts import render
+import time
 
-# Create your views here.
+from django.http import JsonResponse
+from redis.exceptions import RedisError
+
+from apps.common.redis_client import get_redis, pool_stats
+
+
+def redis_health(request):
+    """
+    Ping Redis through the shared pool. Anyone gets the bare status, pool
+    saturation and error details are only shown to staff.
+    """
+    is_staff = request.user.is_active and request.user.is_staff
+    start = time.perf_counter()
+    try:
+        get_redis().ping()
+    except RedisError as e:
+        data = {"status": "error"}
+        if is_staff:
+            data.update(error=str(e), pool=pool_stats())
+        return JsonResponse(data, status=503)
+
+    data = {"status": "ok"}
+    if is_staff:
+        data.update(
+            latency_ms=round((time.perf_counter() - start) * 1000, 2),
+            pool=pool_stats(),
+            cache_pool=pool_stats(decode_responses=False),
+        )
+    return JsonResponse(data)
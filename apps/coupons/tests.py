@@ -1,11 +1,11 @@
-from django.test import TestCase, Client
+from django.test import Client
 from django.urls import reverse
 from django.utils import timezone
-from apps.common.utils import TestUtil
+from apps.common.utils import RedisTestCase, TestUtil
 from apps.coupons.models import Coupon, CouponUsage
 
 
-class TestCouponApplyView(TestCase):
+class TestCouponApplyView(RedisTestCase):
     def setUp(self):
         """Set up the test client and initial data."""
         self.client = Client()
@@ -1,7 +1,9 @@
 from django.contrib import admin
+from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from . import models
+from .invoices import start_invoice_export
 
 
 class OrderItemInline(admin.TabularInline):
@@ -25,10 +27,21 @@ def order_pdf(obj):
 order_pdf.short_description = "Invoice"
 
 
+@admin.action(description="Export invoices as ZIP")
+def export_invoices(modeladmin, request, queryset):
+    # use the date filter to select a range, then "select all"
+    order_ids = queryset.order_by("placed_at").values_list("id", flat=True)
+    export_id = start_invoice_export(order_ids)
+    return redirect("orders:admin_invoice_export", export_id=export_id)
+
+
 @admin.register(models.Order)
 class OrderAdmin(admin.ModelAdmin):
     autocomplete_fields = ["customer"]
     inlines = [OrderItemInline]
+    actions = [export_invoices]
+    date_hierarchy = "placed_at"
+    list_filter = ["paid", "placed_at"]
     list_display = [
         "id",
         "placed_at",
@@ -39,4 +52,9 @@ class OrderAdmin(admin.ModelAdmin):
         order_pdf,
     ]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # the delivery fee or discount may have changed along with the items
+        form.instance.recalculate_totals()
+
 admin.site.register(models.Delivery)
\ No newline at end of file
@@ -0,0 +1,196 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.shop.business_logic import queue_for_index
+from apps.shop.models import Product
+from .models import Delivery, Order, OrderItem, StockReservation
+
+DELIVERY_CACHE_KEY = "orders:delivery"
+
+
+class OutOfStockError(Exception):
+    """A cart line asks for more units than are left in stock."""
+
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f"{product} is out of stock")
+
+
+def get_delivery():
+    """
+    The delivery option applied to new orders, cached until a Delivery
+    is saved or deleted (see apps.orders.signals).
+    """
+    delivery = cache.get(DELIVERY_CACHE_KEY)
+    if delivery is None:
+        delivery = Delivery.objects.first() or False
+        cache.set(DELIVERY_CACHE_KEY, delivery, timeout=None)
+    return delivery or None
+
+
+def reserve_stock(lines):
+    """
+    Take the ordered quantities out of stock with one conditional UPDATE
+    per product, so concurrent checkouts can never sell the same unit twice
+    and no row stays locked while Python runs. Must run in a transaction:
+    a line that can't be served raises and the earlier ones roll back.
+    """
+    # a stable order keeps concurrent checkouts from deadlocking each other
+    lines = sorted(lines, key=lambda item: str(item["product"].pk))
+    for item in lines:
+        updated = Product.objects.filter(
+            pk=item["product"].pk, in_stock__gte=item["quantity"]
+        ).update(in_stock=F("in_stock") - item["quantity"])
+        if not updated:
+            raise OutOfStockError(item["product"])
+    # .update() sends no signals, refresh search and the cached cards ourselves
+    queue_for_index(item["product"].pk for item in lines)
+
+
+def place_order(profile, cart):
+    """
+    Turn the cart into an order: one INSERT for the order, one for all of
+    its items and one for the stock holds, all in a single transaction.
+    Raises OutOfStockError, leaving nothing behind, if stock ran out.
+    """
+    lines = list(cart)
+    delivery = get_delivery()
+    coupon = cart.coupon
+
+    order = Order(
+        customer=profile,
+        delivery=delivery,
+        delivery_fee=delivery.fee if delivery else 0,
+        coupon=coupon,
+        discount=coupon.discount if coupon else 0,
+    )
+    items = [
+        OrderItem(
+            order=order,
+            product=item["product"],
+            price=item["price"],
+            quantity=item["quantity"],
+        )
+        for item in lines
+    ]
+    order.set_totals(sum(item["total_price"] for item in lines))
+    expires_at = timezone.now() + timedelta(minutes=settings.STOCK_HOLD_MINUTES)
+    reservations = [
+        StockReservation(
+            order=order,
+            product=item["product"],
+            quantity=item["quantity"],
+            expires_at=expires_at,
+        )
+        for item in lines
+    ]
+
+    with transaction.atomic():
+        reserve_stock(lines)
+        order.save(force_insert=True)
+        OrderItem.objects.bulk_create(items)
+        StockReservation.objects.bulk_create(reservations)
+    return order
+
+
+def restock(reservations):
+    """Put the units of `reservations` back in stock, one UPDATE per product."""
+    quantities = defaultdict(int)
+    for reservation in reservations:
+        quantities[reservation.product_id] += reservation.quantity
+    for product_id in sorted(quantities, key=str):
+        Product.objects.filter(pk=product_id).update(
+            in_stock=F("in_stock") + quantities[product_id]
+        )
+    queue_for_index(quantities)
+
+
+def release_reservations(reservations):
+    """
+    Release the held reservations among `reservations` (a queryset) and
+    return the number of units put back in stock. Rows another worker is
+    releasing are skipped rather than waited for.
+    """
+    with transaction.atomic():
+        held = list(
+            reservations.filter(status=StockReservation.STATUS_HELD)
+            .select_for_update(skip_locked=True)
+            .only("id", "product_id", "quantity")
+        )
+        if not held:
+            return 0
+        restock(held)
+        StockReservation.objects.filter(pk__in=[r.pk for r in held]).update(
+            status=StockReservation.STATUS_RELEASED
+        )
+    return sum(r.quantity for r in held)
+
+
+def release_expired_reservations():
+    return release_reservations(
+        StockReservation.objects.filter(expires_at__lt=timezone.now())
+    )
+
+
+def renew_reservations(order):
+    """
+    Hold the stock of an unpaid order again right before its payment
+    starts, since the order stays payable far longer than its holds last.
+    Released holds are taken again with conditional UPDATEs and every hold
+    gets a new expiry. Raises OutOfStockError, changing nothing, if a
+    released product sold out in the meantime.
+    """
+    expires_at = timezone.now() + timedelta(minutes=settings.STOCK_HOLD_MINUTES)
+    with transaction.atomic():
+        # lock the holds so the expiry sweep skips them while they're renewed
+        reservations = list(
+            order.reservations.exclude(status=StockReservation.STATUS_COMMITTED)
+            .select_for_update(of=("self",))
+            .select_related("product")
+        )
+        released = [
+            {"product": reservation.product, "quantity": reservation.quantity}
+            for reservation in reservations
+            if reservation.status == StockReservation.STATUS_RELEASED
+        ]
+        reserve_stock(released)
+        StockReservation.objects.filter(pk__in=[r.pk for r in reservations]).update(
+            status=StockReservation.STATUS_HELD, expires_at=expires_at
+        )
+
+
+def commit_reservations(order):
+    """
+    Make the holds of a paid order permanent. Holds that expired before the
+    payment came in are taken again where stock allows; the products that
+    could not be taken again are returned so staff can be told.
+    """
+    with transaction.atomic():
+        # wait for a release in progress so its outcome is seen below; lock
+        # only the reservations, products are changed by conditional UPDATEs
+        reservations = list(
+            order.reservations.select_for_update(of=("self",)).select_related("product")
+        )
+        short = []
+        taken_ids = []
+        for reservation in reservations:
+            if reservation.status != StockReservation.STATUS_RELEASED:
+                continue
+            taken = Product.objects.filter(
+                pk=reservation.product_id, in_stock__gte=reservation.quantity
+            ).update(in_stock=F("in_stock") - reservation.quantity)
+            if taken:
+                taken_ids.append(reservation.product_id)
+            else:
+                short.append(reservation.product)
+        queue_for_index(taken_ids)
+        order.reservations.exclude(status=StockReservation.STATUS_COMMITTED).update(
+            status=StockReservation.STATUS_COMMITTED
+        )
+    return short
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import time
+import uuid
+import zipfile
+from functools import lru_cache
+
+import weasyprint
+from celery import group
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, storages
+from django.template.loader import render_to_string
+
+from apps.common.redis_client import get_redis
+
+
+@lru_cache(maxsize=None)
+def get_invoice_stylesheet():
+    """pdf.css, parsed once per process and reused by every render."""
+    return weasyprint.CSS(finders.find("assets/css/pdf.css"))
+
+
+def get_invoice_storage():
+    return storages["invoices"]
+
+
+def invoice_name(order):
+    return f"{order.id}.pdf"
+
+
+def render_invoice_html(order):
+    return render_to_string("orders/order/pdf.html", {"order": order})
+
+
+def render_invoice_pdf(html):
+    return weasyprint.HTML(string=html).write_pdf(
+        stylesheets=[get_invoice_stylesheet()]
+    )
+
+
+def ensure_invoice(order):
+    """
+    Make sure the stored invoice of the order is up to date. The HTML is
+    cheap to render, so it is fingerprinted and the PDF is only rendered
+    again when the fingerprint changed, i.e. when the order did.
+    Returns the name of the stored file.
+    """
+    storage = get_invoice_storage()
+    name = invoice_name(order)
+    html = render_invoice_html(order)
+    fingerprint = hashlib.sha1(html.encode()).hexdigest()
+    if order.invoice_hash == fingerprint and storage.exists(name):
+        return name
+
+    save_invoice(storage, name, render_invoice_pdf(html))
+    order.invoice_hash = fingerprint
+    order.save(update_fields=["invoice_hash"])
+    return name
+
+
+def save_invoice(storage, name, pdf):
+    """
+    Write the PDF under a temporary name and rename it over the old one,
+    so concurrent renders and downloads never see a missing or partial file.
+    """
+    if not isinstance(storage, FileSystemStorage):
+        # no local files to rename (e.g. InMemoryStorage), replace in place
+        storage.delete(name)
+        storage.save(name, ContentFile(pdf))
+        return
+    temp_name = storage.save(f"{name}.{uuid.uuid4().hex}.tmp", ContentFile(pdf))
+    os.replace(storage.path(temp_name), storage.path(name))
+
+
+def open_invoice(order):
+    """The up to date invoice of the order, opened for reading."""
+    return get_invoice_storage().open(ensure_invoice(order), "rb")
+
+
+INVOICE_EXPORT_PREFIX = "invoices:export"
+
+
+def export_keys(export_id):
+    """Redis keys of an export: its progress hash and its list of order ids."""
+    key = f"{INVOICE_EXPORT_PREFIX}:{export_id}"
+    return key, f"{key}:orders"
+
+
+def start_invoice_export(order_ids):
+    """
+    Render the invoices of the orders in parallel Celery tasks, one per
+    chunk of INVOICE_EXPORT_CHUNK_SIZE orders. Returns the export id used
+    to follow the progress and to download the ZIP.
+    """
+    from apps.orders.tasks import generate_invoices
+
+    order_ids = [str(id) for id in order_ids]
+    export_id = uuid.uuid4().hex
+    progress_key, orders_key = export_keys(export_id)
+    ttl = settings.INVOICE_EXPORT_TTL
+
+    pipe = get_redis().pipeline()
+    pipe.hset(
+        progress_key,
+        mapping={
+            "total": len(order_ids),
+            "done": 0,
+            "failed": 0,
+            "started_at": int(time.time()),
+        },
+    )
+    pipe.expire(progress_key, ttl)
+    if order_ids:
+        pipe.rpush(orders_key, *order_ids)
+        pipe.expire(orders_key, ttl)
+    pipe.execute()
+
+    size = settings.INVOICE_EXPORT_CHUNK_SIZE
+    chunks = [order_ids[i:i + size] for i in range(0, len(order_ids), size)]
+    if chunks:
+        group(generate_invoices.s(export_id, chunk) for chunk in chunks).apply_async()
+    return export_id
+
+
+def record_invoice_progress(export_id, done=0, failed=0):
+    """
+    Count rendered and failed invoices of an export. The TTL is set again
+    with every update, so a late update can't leave a key that never expires.
+    """
+    progress_key = export_keys(export_id)[0]
+    pipe = get_redis().pipeline()
+    if done:
+        pipe.hincrby(progress_key, "done", done)
+    if failed:
+        pipe.hincrby(progress_key, "failed", failed)
+    pipe.expire(progress_key, settings.INVOICE_EXPORT_TTL)
+    pipe.execute()
+
+
+def invoice_export_progress(export_id):
+    """
+    Progress of an export, None when it is unknown or expired. Invoices
+    still missing INVOICE_EXPORT_DEADLINE seconds after the start count as
+    failed, so an export whose workers died still finishes.
+    """
+    progress = get_redis().hgetall(export_keys(export_id)[0])
+    if "total" not in progress:
+        # expired, possibly recreated by an update that came in late
+        return None
+    progress = {key: int(value) for key, value in progress.items()}
+    started_at = progress.pop("started_at", 0)
+    missing = progress["total"] - progress["done"] - progress["failed"]
+    progress["timed_out"] = (
+        missing > 0 and time.time() - started_at > settings.INVOICE_EXPORT_DEADLINE
+    )
+    if progress["timed_out"]:
+        progress["failed"] += missing
+    progress["finished"] = progress["done"] + progress["failed"] >= progress["total"]
+    return progress
+
+
+class ZipStream:
+    """Write-only file object collecting what zipfile writes until taken."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_invoice_zip(export_id):
+    """
+    Yield a ZIP of the exported invoices piece by piece, so only one PDF
+    is held in memory at a time. Invoices that failed to render are left
+    out.
+    """
+    order_ids = get_redis().lrange(export_keys(export_id)[1], 0, -1)
+    storage = get_invoice_storage()
+    stream = ZipStream()
+    # PDFs are compressed already
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED) as archive:
+        for order_id in order_ids:
+            name = f"{order_id}.pdf"
+            if not storage.exists(name):
+                continue
+            with storage.open(name, "rb") as invoice:
+                archive.writestr(f"invoice_{order_id}.pdf", invoice.read())
+            yield stream.take()
+    yield stream.take()
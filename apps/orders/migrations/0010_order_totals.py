@@ -0,0 +1,54 @@
+# Generated by Django 5.1 on 2026-10-18 12:25
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    orders = Order.objects.annotate(
+        items_cost=Coalesce(
+            Sum(F("items__price") * F("items__quantity"), output_field=DecimalField()),
+            Decimal(0),
+            output_field=DecimalField(),
+        )
+    )
+    for order in orders.iterator():
+        subtotal = order.items_cost + order.delivery_fee
+        discount_amount = (subtotal * Decimal(order.discount) / Decimal(100)).quantize(
+            Decimal("0.01")
+        )
+        Order.objects.filter(pk=order.pk).update(
+            subtotal=subtotal,
+            discount_amount=discount_amount,
+            total=subtotal - discount_amount,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_order_orders_orde_paid_27cb41_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
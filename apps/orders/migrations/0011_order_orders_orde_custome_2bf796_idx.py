@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'shipping_status', 'placed_at'], name='orders_orde_custome_2bf796_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_orders_orde_custome_2bf796_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='invoice_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
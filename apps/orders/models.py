@@ -1,6 +1,7 @@
 from decimal import Decimal
 from django.conf import settings
 from django.db import models
+from django.db.models import F, Sum
 from django.core.validators import MaxValueValidator, MinValueValidator
 
 from apps.common.models import BaseModel
@@ -8,6 +9,8 @@ from apps.coupons.models import Coupon
 from apps.profiles.models import Profile
 from apps.shop.models import Product
 
+CENT = Decimal("0.01")
+
 class Delivery(models.Model):
     fee = models.PositiveSmallIntegerField(default=3000)
     delivery_time = models.CharField(max_length=50, default="1-3 business days")  
@@ -50,28 +53,54 @@ class Order(BaseModel):
     delivery_fee = models.PositiveSmallIntegerField(
         default=0
     )  # if delivery gets deleted. order is preserved
+    # stored totals, kept up to date by set_totals()/recalculate_totals()
+    subtotal = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, editable=False
+    )  # items and delivery, before discount
+    discount_amount = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, editable=False
+    )
+    total = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, editable=False
+    )
+    # fingerprint of the stored invoice, see apps.orders.invoices
+    invoice_hash = models.CharField(max_length=40, blank=True, editable=False)
     
     class Meta:
         ordering = ["-placed_at"]
         indexes = [
             models.Index(fields=["-placed_at"]),
+            models.Index(fields=["paid", "placed_at"]),  # expiry sweep
+            models.Index(fields=["customer", "shipping_status", "placed_at"]),  # history
         ]
 
     def __str__(self):
         return f"Order {self.id} by {self.customer.user.full_name}"
 
+    def set_totals(self, items_cost):
+        """Fill in the stored totals from the cost of the items."""
+        self.subtotal = Decimal(items_cost) + self.delivery_fee
+        self.discount_amount = (
+            self.subtotal * Decimal(self.discount) / Decimal(100)
+        ).quantize(CENT)
+        self.total = self.subtotal - self.discount_amount
+
+    def recalculate_totals(self):
+        """Recompute the stored totals from the items, e.g. after they changed."""
+        cost = self.items.aggregate(
+            cost=Sum(F("price") * F("quantity"), output_field=models.DecimalField())
+        )["cost"]
+        self.set_totals(cost or 0)
+        self.save(update_fields=["subtotal", "discount_amount", "total"])
+
     def get_total_cost(self):
-        total_cost = self.get_total_cost_before_discount() 
-        return total_cost - self.get_discount() 
+        return self.total
 
     def get_total_cost_before_discount(self):
-        return sum(item.get_cost() for item in self.items.all()) + self.delivery_fee
+        return self.subtotal
 
     def get_discount(self):
-        total_cost = self.get_total_cost_before_discount()
-        if self.discount:
-            return total_cost * (self.discount / Decimal(100))
-        return Decimal(0)
+        return self.discount_amount
     
 
 class OrderItem(BaseModel):
@@ -85,5 +114,56 @@ class OrderItem(BaseModel):
     def get_cost(self):
         return self.price * self.quantity
 
+    # Keep the order totals right when a single item is edited (e.g. in the
+    # admin). Checkout uses bulk_create and sets the totals itself, and
+    # deleting a whole order skips this so its items can be fast-deleted.
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.order.recalculate_totals()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.order.recalculate_totals()
+        return result
+
     def __str__(self):
         return f"{self.quantity} of {self.product} in order {self.order.id}"
+
+
+class StockReservation(BaseModel):
+    """
+    Units of a product held for an unpaid order. The units are taken out of
+    Product.in_stock when the order is placed, so in_stock is always the
+    quantity left to sell. A hold is committed when the order is paid, or
+    released (the units go back in stock) once it expires.
+    """
+
+    STATUS_HELD = "H"
+    STATUS_COMMITTED = "C"
+    STATUS_RELEASED = "R"
+
+    STATUS_CHOICES = [
+        (STATUS_HELD, "HELD"),
+        (STATUS_COMMITTED, "COMMITTED"),
+        (STATUS_RELEASED, "RELEASED"),
+    ]
+
+    order = models.ForeignKey(
+        Order, related_name="reservations", on_delete=models.CASCADE
+    )
+    product = models.ForeignKey(
+        Product, related_name="reservations", on_delete=models.CASCADE
+    )
+    quantity = models.PositiveSmallIntegerField()
+    status = models.CharField(
+        max_length=1, choices=STATUS_CHOICES, default=STATUS_HELD
+    )
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} of {self.product} held for order {self.order_id}"
@@ -0,0 +1,15 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .business_logic import DELIVERY_CACHE_KEY
+from .models import Delivery
+
+
+@receiver(post_save, sender=Delivery)
+@receiver(post_delete, sender=Delivery)
+def delivery_changed(sender, instance, **kwargs):
+    # again after commit, a checkout running meanwhile may re-cache the old row
+    cache.delete(DELIVERY_CACHE_KEY)
+    transaction.on_commit(lambda: cache.delete(DELIVERY_CACHE_KEY))
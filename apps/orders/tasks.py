@@ -1,9 +1,23 @@
+import logging
+import time
+from datetime import timedelta
+from itertools import islice
+
 from celery import shared_task
-from django.core.mail import EmailMessage
+from django.conf import settings
+from django.db import transaction
 from django.template.loader import render_to_string
-from datetime import timedelta
 from django.utils import timezone
-from .models import Order
+
+from apps.common.emails import queue_email
+from apps.common.redis_client import get_redis
+from .business_logic import release_expired_reservations, release_reservations
+from .invoices import ensure_invoice, record_invoice_progress
+from .models import Order, StockReservation
+
+logger = logging.getLogger(__name__)
+
+ORDER_EXPIRY_STATS_KEY = "orders:expiry:stats"
 
 
 @shared_task
@@ -19,32 +33,116 @@ def order_created(order_id):
         "order": order,
     }
     message = render_to_string("orders/emails/order_placed.html", context)
-    email_message = EmailMessage(subject=subject, body=message, to=[user.email])
-    email_message.content_subtype = "html"
-    email_message.send(fail_silently=False)
+    queue_email(subject, message, [user.email])
 
-def order_canceled(order_id): 
-    order = Order.objects.get(id=order_id)
-    user = order.customer.user
-    subject = f"Canceled Order nr. {order.id} - Your order could not be completed"
+@shared_task
+def order_canceled(order_id, email, first_name):
+    """
+    Task to send an e-mail notification when an unpaid order is canceled.
+    The order is already deleted, so everything needed is passed in.
+    """
+    subject = f"Canceled Order nr. {order_id} - Your order could not be completed"
     context = {
-        "order": order,
+        "order_id": order_id,
+        "first_name": first_name,
         "domain": "http://127.0.0.1:8000",
     }
     message = render_to_string("orders/emails/order_canceled.html", context)
-    email_message = EmailMessage(subject=subject, body=message, to=[user.email])
-    email_message.content_subtype = "html"
-    email_message.send(fail_silently=False)
-    
+    queue_email(subject, message, [email])
+
+
+def cancel_orders(rows):
+    """
+    Delete a chunk of expired orders, given as (id, email, first name) rows,
+    and put their held stock back. Orders paid in the meantime are left
+    alone. Returns (orders canceled, units released).
+    """
+    customers = {row[0]: row[1:] for row in rows}
+    with transaction.atomic():
+        ids = list(
+            Order.objects.filter(pk__in=customers, paid=False)
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)
+        )
+        if not ids:
+            return 0, 0
+        released = release_reservations(StockReservation.objects.filter(order_id__in=ids))
+        Order.objects.filter(pk__in=ids).delete()
+
+        def notify():
+            for order_id in ids:
+                order_canceled.delay(str(order_id), *customers[order_id])
+
+        transaction.on_commit(notify)
+    return len(ids), released
+
+
 @shared_task
 def cancel_expired_orders():
-    expiration = timezone.now() + timedelta(hours=24)
-    expired_orders = Order.objects.filter(
-        paid=False, # Check if the order is not paid
-        placed_at__gt=expiration  # Check expiration
+    """
+    Cancel the orders left unpaid for ORDER_PAYMENT_WINDOW_HOURS, in chunks
+    of ORDER_EXPIRY_BATCH_SIZE walked on the (paid, placed_at) index.
+    """
+    start = time.perf_counter()
+    batch_size = settings.ORDER_EXPIRY_BATCH_SIZE
+    expiration = timezone.now() - timedelta(hours=settings.ORDER_PAYMENT_WINDOW_HOURS)
+    expired_orders = (
+        Order.objects.filter(paid=False, placed_at__lt=expiration)
+        .order_by("placed_at")
+        .values_list("id", "customer__user__email", "customer__user__first_name")
     )
 
-    for order in expired_orders:
-        print(f"Cancelling expired order {order.id}") # TODO: REMOVE LATER
-        order_canceled(order.id)
-        order.delete()
\ No newline at end of file
+    canceled = released = 0
+    rows = expired_orders.iterator(chunk_size=batch_size)
+    while chunk := list(islice(rows, batch_size)):
+        chunk_canceled, chunk_released = cancel_orders(chunk)
+        canceled += chunk_canceled
+        released += chunk_released
+
+    stats = {
+        "canceled": canceled,
+        "units_released": released,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+    record_expiry_stats(stats)
+    logger.info("Expired orders sweep: %s", stats)
+    return stats
+
+
+def record_expiry_stats(stats):
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hincrby(ORDER_EXPIRY_STATS_KEY, "runs", 1)
+    pipe.hincrby(ORDER_EXPIRY_STATS_KEY, "canceled", stats["canceled"])
+    pipe.hincrby(ORDER_EXPIRY_STATS_KEY, "units_released", stats["units_released"])
+    pipe.hset(ORDER_EXPIRY_STATS_KEY, "last_canceled", stats["canceled"])
+    pipe.hset(ORDER_EXPIRY_STATS_KEY, "last_duration_ms", stats["duration_ms"])
+    pipe.execute()
+
+
+@shared_task
+def release_expired_stock():
+    """Put the stock held by orders that weren't paid in time back on sale."""
+    return release_expired_reservations()
+
+
+@shared_task
+def generate_invoices(export_id, order_ids):
+    """Render the invoices of one chunk of an export, see start_invoice_export."""
+    orders = (
+        Order.objects.filter(pk__in=order_ids)
+        .select_related("customer__user")
+        .prefetch_related("items__product")
+    )
+    found = 0
+    for order in orders:
+        found += 1
+        try:
+            ensure_invoice(order)
+        except Exception:
+            logger.exception("Could not render the invoice of order %s", order.id)
+            record_invoice_progress(export_id, failed=1)
+        else:
+            record_invoice_progress(export_id, done=1)
+    if found < len(order_ids):
+        # deleted since the export started
+        record_invoice_progress(export_id, failed=len(order_ids) - found)
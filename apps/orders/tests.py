@@ -1,14 +1,43 @@
-from django.test import TestCase, Client
+import time
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from apps.common.utils import TestUtil
+from apps.common.redis_client import get_redis
+from apps.common.utils import RedisTestCase, TestUtil
 
-from apps.orders.models import Order, OrderItem, Delivery
+from apps.orders.business_logic import (
+    OutOfStockError,
+    commit_reservations,
+    release_expired_reservations,
+    renew_reservations,
+)
+from apps.orders.invoices import (
+    export_keys,
+    invoice_export_progress,
+    start_invoice_export,
+)
+from apps.orders.models import Order, OrderItem, Delivery, StockReservation
+from apps.orders.tasks import cancel_expired_orders, generate_invoices
+from apps.shop.models import Product
 
 from unittest.mock import patch
 
+TEST_STORAGES = {
+    **settings.STORAGES,
+    "invoices": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+}
+
 
-class OrderViewsTestCase(TestCase):
+class OrderViewsTestCase(RedisTestCase):
     def setUp(self):
         self.client = Client()
         self.user = TestUtil.verified_user()
@@ -41,6 +70,34 @@ class OrderViewsTestCase(TestCase):
         self.assertEqual(order.delivery_fee, self.delivery.fee)
         mock_task.assert_called_once_with(order.id)
 
+    @patch("apps.orders.tasks.order_created.delay")
+    def test_order_create_post_reserves_stock(self, mock_task):
+        add_url = reverse("cart:cart_add", args=[self.product.id])
+        self.client.post(add_url, {"quantity": 3, "override": True})
+
+        self.client.post(reverse("orders:order_create"))
+
+        order = Order.objects.exclude(id=self.order.id).get()
+        self.assertEqual(order.items.get().quantity, 3)
+        self.assertEqual(order.reservations.get().status, StockReservation.STATUS_HELD)
+        self.assertEqual(order.subtotal, Decimal("150.00") + self.delivery.fee)
+        self.assertEqual(order.total, order.subtotal)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 7)
+
+    @patch("apps.orders.tasks.order_created.delay")
+    def test_order_create_post_out_of_stock(self, mock_task):
+        add_url = reverse("cart:cart_add", args=[self.product.id])
+        self.client.post(add_url, {"quantity": 11, "override": True})
+
+        response = self.client.post(reverse("orders:order_create"))
+
+        self.assertRedirects(response, reverse("cart:cart_detail"))
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 10)
+        mock_task.assert_not_called()
+
     def test_order_created_get(self):
         response = self.client.get(
             reverse("orders:order_created", args=[self.order.id])
@@ -59,6 +116,34 @@ class OrderViewsTestCase(TestCase):
         self.assertTemplateUsed(response, "orders/order/order_history.html")
         # print(response.context["orders"])
 
+    def test_order_history_is_paginated_by_keyset(self):
+        for _ in range(12):
+            order = Order.objects.create(
+                customer=self.profile, shipping_status=Order.SHIPPING_STATUS_PENDING
+            )
+            OrderItem.objects.create(order=order, product=self.product, price=50)
+        url = reverse("orders:order_history")
+        # the first request also writes one-time session data
+        self.client.get(url, {"shipping_status": "P"})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"shipping_status": "P"})
+        first_page = response.context["orders"]
+        # more items per order don't cost more queries
+        OrderItem.objects.create(order=first_page[0], product=self.product, price=50)
+        with self.assertNumQueries(len(queries)):
+            self.client.get(url, {"shipping_status": "P"})
+
+        self.assertEqual(len(first_page), 10)
+
+        response = self.client.get(
+            url, {"shipping_status": "P", "cursor": response.context["next_cursor"]}
+        )
+        second_page = response.context["orders"]
+        self.assertEqual(len(second_page), 2)
+        self.assertIsNone(response.context["next_cursor"])
+        self.assertFalse({o.id for o in first_page} & {o.id for o in second_page})
+
     def test_order_item_detail_get(self):
         order_item = OrderItem.objects.create(
             order=self.order, product=self.product, price=50
@@ -78,6 +163,7 @@ class OrderViewsTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "admin/orders/order/detail.html")
 
+    @override_settings(STORAGES=TEST_STORAGES)
     def test_admin_order_pdf(self):
         self.client.force_login(self.admin_user)
         response = self.client.get(
@@ -85,3 +171,185 @@ class OrderViewsTestCase(TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response["Content-Type"], "application/pdf")
+
+    @override_settings(STORAGES=TEST_STORAGES)
+    def test_admin_order_pdf_is_rendered_once_per_change(self):
+        self.client.force_login(self.admin_user)
+        url = reverse("orders:admin_order_pdf", args=[self.order.id])
+        with patch(
+            "apps.orders.invoices.render_invoice_pdf", return_value=b"%PDF"
+        ) as render_pdf:
+            self.client.get(url)
+            response = self.client.get(url)
+            self.assertEqual(b"".join(response.streaming_content), b"%PDF")
+            self.assertEqual(render_pdf.call_count, 1)
+
+            OrderItem.objects.create(order=self.order, product=self.product, price=50)
+            self.client.get(url)
+            self.assertEqual(render_pdf.call_count, 2)
+
+
+class OrderTotalsTestCase(RedisTestCase):
+    def setUp(self):
+        self.product = TestUtil.create_product()
+        self.order = Order.objects.create(
+            customer=TestUtil.verified_user().profile, delivery_fee=100, discount=10
+        )
+
+    def test_totals_follow_item_changes(self):
+        item = OrderItem.objects.create(
+            order=self.order, product=self.product, price=50, quantity=2
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.get_total_cost_before_discount(), Decimal("200.00"))
+        self.assertEqual(self.order.get_discount(), Decimal("20.00"))
+        self.assertEqual(self.order.get_total_cost(), Decimal("180.00"))
+
+        item.delete()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.get_total_cost(), Decimal("90.00"))
+
+    def test_totals_are_read_without_queries(self):
+        OrderItem.objects.create(order=self.order, product=self.product, price=50)
+        order = Order.objects.get(pk=self.order.pk)
+        with self.assertNumQueries(0):
+            order.get_total_cost()
+            order.get_discount()
+
+
+class StockReservationTestCase(RedisTestCase):
+    def setUp(self):
+        self.profile = TestUtil.verified_user().profile
+        self.product = TestUtil.create_product()
+        self.order = Order.objects.create(customer=self.profile)
+        self.reservation = StockReservation.objects.create(
+            order=self.order,
+            product=self.product,
+            quantity=4,
+            expires_at=timezone.now() - timedelta(minutes=1),
+        )
+        # placing the order took the units out of stock
+        Product.objects.filter(pk=self.product.pk).update(in_stock=6)
+
+    def test_expired_holds_are_released(self):
+        self.assertEqual(release_expired_reservations(), 4)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 10)
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, StockReservation.STATUS_RELEASED)
+
+        # a second sweep finds nothing left to release
+        self.assertEqual(release_expired_reservations(), 0)
+
+    def test_late_payment_takes_the_stock_again(self):
+        release_expired_reservations()
+
+        self.assertEqual(commit_reservations(self.order), [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 6)
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, StockReservation.STATUS_COMMITTED)
+
+    def test_late_payment_reports_sold_out_products(self):
+        release_expired_reservations()
+        Product.objects.filter(pk=self.product.pk).update(in_stock=1)
+
+        self.assertEqual(commit_reservations(self.order), [self.product])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 1)
+
+    def test_payment_start_renews_expired_holds(self):
+        release_expired_reservations()
+
+        renew_reservations(self.order)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 6)
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, StockReservation.STATUS_HELD)
+        self.assertGreater(self.reservation.expires_at, timezone.now())
+
+    def test_payment_start_is_refused_when_sold_out(self):
+        release_expired_reservations()
+        Product.objects.filter(pk=self.product.pk).update(in_stock=1)
+
+        with self.assertRaises(OutOfStockError):
+            renew_reservations(self.order)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 1)
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, StockReservation.STATUS_RELEASED)
+
+
+class CancelExpiredOrdersTestCase(RedisTestCase):
+    def setUp(self):
+        self.user = TestUtil.verified_user()
+        self.product = TestUtil.create_product()
+        long_ago = timezone.now() - timedelta(hours=25)
+
+        self.expired = Order.objects.create(customer=self.user.profile)
+        StockReservation.objects.create(
+            order=self.expired, product=self.product, quantity=2, expires_at=long_ago
+        )
+        self.paid = Order.objects.create(customer=self.user.profile, paid=True)
+        Order.objects.filter(pk__in=[self.expired.pk, self.paid.pk]).update(
+            placed_at=long_ago
+        )
+        self.recent = Order.objects.create(customer=self.user.profile)
+
+    @patch("apps.orders.tasks.order_canceled.delay")
+    def test_only_expired_unpaid_orders_are_canceled(self, mock_email):
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = cancel_expired_orders()
+
+        self.assertEqual(stats["canceled"], 1)
+        self.assertEqual(stats["units_released"], 2)
+        self.assertQuerySetEqual(
+            Order.objects.order_by("placed_at"), [self.paid, self.recent]
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 12)
+        mock_email.assert_called_once_with(
+            str(self.expired.id), self.user.email, self.user.first_name
+        )
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class InvoiceExportTestCase(RedisTestCase):
+    def setUp(self):
+        profile = TestUtil.verified_user().profile
+        self.orders = [Order.objects.create(customer=profile) for _ in range(3)]
+        self.client.force_login(TestUtil.admin_user())
+
+    @patch("apps.orders.invoices.render_invoice_pdf", return_value=b"%PDF")
+    @patch("apps.orders.invoices.group")
+    def test_export_is_streamed_as_zip(self, mock_group, mock_render):
+        ids = [order.id for order in self.orders]
+        export_id = start_invoice_export(ids)
+        status_url = reverse("orders:admin_invoice_export_status", args=[export_id])
+        self.assertFalse(self.client.get(status_url).json()["finished"])
+
+        generate_invoices(export_id, [str(id) for id in ids])
+        self.assertEqual(
+            self.client.get(status_url).json(),
+            {"total": 3, "done": 3, "failed": 0, "timed_out": False, "finished": True},
+        )
+
+        response = self.client.get(
+            reverse("orders:admin_invoice_export_download", args=[export_id])
+        )
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(
+            sorted(archive.namelist()), sorted(f"invoice_{id}.pdf" for id in ids)
+        )
+
+    @patch("apps.orders.invoices.group")
+    def test_export_finishes_when_workers_miss_the_deadline(self, mock_group):
+        export_id = start_invoice_export([order.id for order in self.orders])
+        self.assertFalse(invoice_export_progress(export_id)["finished"])
+
+        started_at = time.time() - settings.INVOICE_EXPORT_DEADLINE - 1
+        get_redis().hset(export_keys(export_id)[0], "started_at", int(started_at))
+        progress = invoice_export_progress(export_id)
+        self.assertTrue(progress["finished"])
+        self.assertTrue(progress["timed_out"])
+        self.assertEqual(progress["failed"], 3)
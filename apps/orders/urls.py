@@ -20,4 +20,19 @@ urlpatterns = [
     path(
         "admin/order/<str:order_id>/pdf/", views.admin_order_pdf, name="admin_order_pdf"
     ),
+    path(
+        "admin/invoices/export/<str:export_id>/",
+        views.admin_invoice_export,
+        name="admin_invoice_export",
+    ),
+    path(
+        "admin/invoices/export/<str:export_id>/status/",
+        views.admin_invoice_export_status,
+        name="admin_invoice_export_status",
+    ),
+    path(
+        "admin/invoices/export/<str:export_id>/download/",
+        views.admin_invoice_export_download,
+        name="admin_invoice_export_download",
+    ),
 ]
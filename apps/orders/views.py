@@ -2,13 +2,16 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.views import View
 from django.contrib.admin.views.decorators import staff_member_required
 from apps.accounts.mixins import LoginRequiredMixin
-import weasyprint
-from django.contrib.staticfiles import finders
-from django.http import HttpResponse
-from django.template.loader import render_to_string
+import sweetify
+from django.db.models import Prefetch, Q
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
 from apps.cart.cart import Cart
+from apps.common.validators import validate_uuid
 from apps.profiles.models import Profile
-from .models import Delivery, Order, OrderItem
+from .business_logic import OutOfStockError, place_order
+from .invoices import invoice_export_progress, iter_invoice_zip, open_invoice
+from .models import Order, OrderItem
 from .tasks import order_created
 
 
@@ -27,7 +30,7 @@ class OrderCreate(LoginRequiredMixin, View):
             "user": user,
             "profile": profile,
             "cart": cart,
-            "total_cost": sum(item["price"] * item["quantity"] for item in cart),
+            "total_cost": cart.get_total_price(),
         }
 
         return render(request, "orders/order/create.html", order_summary)
@@ -40,35 +43,15 @@ class OrderCreate(LoginRequiredMixin, View):
         user = request.user
         profile = get_object_or_404(Profile, user=user)
 
-        # Create the order
-        # order = Order.objects.create(customer=profile)
-
-        # Create the order instance but do not save it yet
-        order = Order(
-            customer=profile, delivery=Delivery.objects.first()
-        )  # Create an in-memory instance
-
-        # Add coupon details if available
         cart = Cart(request)
-
-        if cart.coupon:
-            order.coupon = cart.coupon
-            order.discount = cart.coupon.discount
-
-        # Save the order after making all changes
-        order.save()
-        
-        if order.delivery:
-            order.delivery_fee = order.delivery.fee
-            order.save(force_update=True)
-
-        for item in cart:
-            OrderItem.objects.create(
-                order=order,
-                product=item["product"],
-                price=item["price"],
-                quantity=item["quantity"],
+        try:
+            order = place_order(profile, cart)
+        except OutOfStockError as e:
+            sweetify.error(
+                request,
+                f"Sorry, {e.product.name} sold out. Please update your cart.",
             )
+            return redirect("cart:cart_detail")
 
         # Clear the cart
         cart.clear()
@@ -95,40 +78,68 @@ class OrderCreated(LoginRequiredMixin, View):
         return render(request, "orders/order/created.html", {"order": order})
 
 
+def order_cursor(order):
+    return f"{order.placed_at.isoformat()}_{order.id}"
+
+
+def parse_order_cursor(cursor):
+    """Split a cursor made by order_cursor(), None if it isn't one."""
+    placed_at, _, order_id = (cursor or "").rpartition("_")
+    try:
+        placed_at = parse_datetime(placed_at)
+    except ValueError:
+        return None
+    if placed_at is None or not validate_uuid(order_id):
+        return None
+    return placed_at, order_id
+
+
 class OrderHistory(LoginRequiredMixin, View):
+    paginate_by = 10
+
     def get(self, request):
         # Fetch orders based on shipping status (Pending, Shipped, Delivered, Canceled)
         status_filter = request.GET.get("shipping_status", "P")
-        unpaid_orders = Order.objects.filter(paid=False)
 
-        if status_filter == "P":
-            orders = Order.objects.filter(
-                customer__user=request.user,
-                shipping_status=Order.SHIPPING_STATUS_PENDING,
-            )
-        elif status_filter == "S":
+        if status_filter in (
+            Order.SHIPPING_STATUS_PENDING,
+            Order.SHIPPING_STATUS_SHIPPED,
+            Order.SHIPPING_STATUS_DELIVERED,
+        ):
             orders = Order.objects.filter(
-                customer__user=request.user,
-                shipping_status=Order.SHIPPING_STATUS_SHIPPED,
-            )
-        elif status_filter == "D":
-            orders = Order.objects.filter(
-                customer__user=request.user,
-                shipping_status=Order.SHIPPING_STATUS_DELIVERED,
+                customer=request.user.profile, shipping_status=status_filter
             )
         else:
+            # unpaid orders have no shipping status yet
             orders = Order.objects.filter(
-                customer__user=request.user,
-                paid=False,
+                customer=request.user.profile, shipping_status="", paid=False
+            )
+
+        # keyset pagination, the cursor is the last order of the previous page
+        cursor = parse_order_cursor(request.GET.get("cursor"))
+        if cursor:
+            placed_at, order_id = cursor
+            orders = orders.filter(
+                Q(placed_at__lt=placed_at) | Q(placed_at=placed_at, id__lt=order_id)
             )
 
+        orders = list(
+            orders.order_by("-placed_at", "-id").prefetch_related(
+                Prefetch("items", queryset=OrderItem.objects.select_related("product"))
+            )[: self.paginate_by + 1]
+        )
+        next_cursor = None
+        if len(orders) > self.paginate_by:
+            orders = orders[: self.paginate_by]
+            next_cursor = order_cursor(orders[-1])
+
         return render(
             request,
             "orders/order/order_history.html",
             {
                 "orders": orders,
                 "status_filter": status_filter,
-                "unpaid orders": unpaid_orders,
+                "next_cursor": next_cursor,
             },
         )
 
@@ -156,16 +167,47 @@ def admin_order_detail(request, order_id):
 
 @staff_member_required
 def admin_order_pdf(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    html = render_to_string(
-        "orders/order/pdf.html",
-        {
-            "order": order,
-        },
+    order = get_object_or_404(
+        Order.objects.select_related("customer__user").prefetch_related(
+            Prefetch("items", queryset=OrderItem.objects.select_related("product"))
+        ),
+        id=order_id,
+    )
+    # only renders the PDF if the order changed since it was stored
+    return FileResponse(
+        open_invoice(order),
+        content_type="application/pdf",
+        filename=f"order_{order.id}.pdf",
+    )
+
+
+@staff_member_required
+def admin_invoice_export(request, export_id):
+    progress = invoice_export_progress(export_id)
+    if progress is None:
+        raise Http404("Unknown or expired export")
+    return render(
+        request,
+        "admin/orders/order/invoice_export.html",
+        {"export_id": export_id, "progress": progress},
     )
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = f"filename=order_{order.id}.pdf"
-    weasyprint.HTML(string=html).write_pdf(
-        response, stylesheets=[weasyprint.CSS(finders.find("assets/css/pdf.css"))]
+
+
+@staff_member_required
+def admin_invoice_export_status(request, export_id):
+    progress = invoice_export_progress(export_id)
+    if progress is None:
+        raise Http404("Unknown or expired export")
+    return JsonResponse(progress)
+
+
+@staff_member_required
+def admin_invoice_export_download(request, export_id):
+    progress = invoice_export_progress(export_id)
+    if progress is None or not progress["finished"]:
+        raise Http404("Unknown or unfinished export")
+    response = StreamingHttpResponse(
+        iter_invoice_zip(export_id), content_type="application/zip"
     )
+    response["Content-Disposition"] = f'attachment; filename="invoices_{export_id}.zip"'
     return response
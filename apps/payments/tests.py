@@ -1,6 +1,6 @@
-from django.test import TestCase, Client
+from django.test import Client
 from django.urls import reverse
-from apps.common.utils import TestUtil
+from apps.common.utils import RedisTestCase, TestUtil
 from apps.shop.models import Product
 from apps.cart.cart import Cart
 from apps.orders.models import Delivery, Order
@@ -9,7 +9,7 @@ from apps.orders.models import Delivery, Order
 from unittest.mock import patch
 
 
-class PaymentProcessTestCase(TestCase):
+class PaymentProcessTestCase(RedisTestCase):
     def setUp(self):
         self.client = Client()
         self.user = TestUtil.verified_user()
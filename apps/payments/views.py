@@ -4,6 +4,7 @@ import requests
 from django.shortcuts import get_object_or_404, redirect, render
 import sweetify
 from apps.coupons.models import CouponUsage
+from apps.orders.business_logic import OutOfStockError, renew_reservations
 from apps.orders.models import Order
 from decimal import Decimal
 from decouple import config
@@ -31,6 +32,8 @@ def payment_process(request):
             # Remove the coupon from the order
             order.coupon = None
             order.discount = 0
+            # the delivery fee is unchanged, only the discount goes away
+            order.set_totals(order.subtotal - order.delivery_fee)
             order.save(force_update=True)
             # Update the order total if the coupon affects it
             amount = order.get_total_cost() * Decimal("100")
@@ -38,6 +41,16 @@ def payment_process(request):
             sweetify.info(request, f"Coupon removed from order {order_id} due to prior redemption.")
 
     if request.method == "POST":
+        # the holds may have run out while the order waited for payment
+        try:
+            renew_reservations(order)
+        except OutOfStockError as e:
+            sweetify.error(
+                request,
+                f"Sorry, {e.product.name} sold out while your order awaited payment.",
+            )
+            return redirect("cart:cart_detail")
+
         success_url = request.build_absolute_uri(
             reverse("payments:success")
         )  # generate absolute url for the url path
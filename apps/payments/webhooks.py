@@ -1,15 +1,18 @@
 import hmac
 import hashlib
 import json
+import logging
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from decouple import config
 from apps.coupons.models import CouponUsage
+from apps.orders.business_logic import commit_reservations
 from apps.orders.models import Order
-from apps.shop.models import Product
-from apps.shop.recommender import Recommender
+from apps.shop.tasks import record_products_bought
 from .tasks import payment_completed
 
+logger = logging.getLogger(__name__)
+
 secret = config("PAYSTACK_TEST_SECRET_KEY")
 
 
@@ -65,16 +68,22 @@ def stack_webhook(request):
             order.save(force_update=True)
             print("PAID")
 
+            # the held stock now belongs to the order
+            short = commit_reservations(order)
+            if short:
+                logger.warning(
+                    "Order %s was paid after its stock hold expired, "
+                    "out of stock: %s", order.id, ", ".join(map(str, short))
+                )
+
             if order.coupon:
                 CouponUsage.objects.create(
                     profile=order.customer.profile, coupon=order.coupon
                 )
                 
             # save items bought for product recommendations
-            product_ids = order.items.values_list('product_id')
-            products = Product.objects.filter(id__in=product_ids)
-            r = Recommender()
-            r.products_bought(products)
+            product_ids = order.items.values_list("product_id", flat=True)
+            record_products_bought.delay([str(id) for id in product_ids])
             
             payment_completed.delay(order.id)
 
@@ -1,11 +1,30 @@
+import hashlib
+import json
 import logging
+import re
+import time
 
+from django.conf import settings
+from django.db import transaction
+
+from apps.common.redis_client import get_redis
+from apps.shop.cache import bump_catalog_cache, bump_product_cards
 from apps.shop.models import Product
-from apps.shop.search_index import search_index
+from apps.shop.search_index import SearchBackendError, get_search_backend
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_SEARCH_ATTRS = ["name", "description"]
+FILTERABLE_ATTRS = ["featured", "flash_deals", "category_slug"]
+
+# ids of products whose search document is out of date
+OUTBOX_KEY = "search:outbox"
+OUTBOX_SCHEDULED_KEY = "search:outbox:scheduled"
+
+# search result cache, keys include the catalog version
+CATALOG_VERSION_KEY = "search:catalog_version"
+SEARCH_CACHE_PREFIX = "search:cache:"
+SEARCH_CACHE_STATS_KEY = "search:cache:stats"
 
 def format_search_str(param):
     """Enclose in quotes if there is a space"""
@@ -15,27 +34,232 @@ def format_search_str(param):
 
 def setup_attributes():
     """Setup index attrs"""
-    search_index.update_searchable_attributes(DEFAULT_SEARCH_ATTRS)
+    return get_search_backend().setup(DEFAULT_SEARCH_ATTRS, FILTERABLE_ATTRS)
+
+
+def build_search_filter(filter_value=None, category=None):
+    """Translate the product list filters into search backend filters"""
+    filters = {}
+    if filter_value in ("featured", "flash_deals"):
+        filters[filter_value] = True
+    if category and re.fullmatch(r"[-\w]+", category):
+        filters["category_slug"] = category
+    return filters
+
+
+def search_products(query, offset=0, limit=20, filters=None):
+    """
+    Run one page of a product search, served from a short-lived cache
+    when the same normalized query was run on the current catalog version.
+    Returns (matching product ids in rank order, estimated total hits).
+    """
+    r = get_redis()
+    normalized = " ".join(query.lower().split())
+    cache_key = hashlib.sha1(
+        json.dumps([normalized, offset, limit, filters or {}], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    cache_key = f"{SEARCH_CACHE_PREFIX}{r.get(CATALOG_VERSION_KEY) or 0}:{cache_key}"
+
+    cached = r.get(cache_key)
+    if cached is not None:
+        r.hincrby(SEARCH_CACHE_STATS_KEY, "hits", 1)
+        ids, total = json.loads(cached)
+        return ids, total
+
+    try:
+        ids, total = get_search_backend().search(normalized, offset, limit, filters)
+    except SearchBackendError:
+        if not settings.SEARCH_FALLBACK_BACKEND:
+            raise
+        # serve from the local engine, and don't cache so we switch back soon
+        logger.warning("search backend unavailable, using fallback", exc_info=True)
+        fallback = get_search_backend(settings.SEARCH_FALLBACK_BACKEND)
+        return fallback.search(normalized, offset, limit, filters)
+
+    pipe = r.pipeline(transaction=False)
+    pipe.set(cache_key, json.dumps([ids, total]), ex=settings.SEARCH_CACHE_TTL)
+    pipe.hincrby(SEARCH_CACHE_STATS_KEY, "misses", 1)
+    pipe.execute()
+    return ids, total
+
+
+def bump_catalog_version():
+    """Invalidate every cached search by moving to a new catalog version"""
+    return get_redis().incr(CATALOG_VERSION_KEY)
+
+
+def search_cache_stats():
+    r = get_redis()
+    pipe = r.pipeline(transaction=False)
+    pipe.hgetall(SEARCH_CACHE_STATS_KEY)
+    pipe.get(CATALOG_VERSION_KEY)
+    stats, version = pipe.execute()
+    hits, misses = int(stats.get("hits", 0)), int(stats.get("misses", 0))
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0,
+        "catalog_version": int(version or 0),
+    }
+
+
+class SearchResults:
+    """
+    Sequence over a product search for Paginator. Only the requested page
+    is fetched from the search backend and it is hydrated into Product objects.
+    """
+
+    def __init__(self, query, queryset, page=1, per_page=20, filters=None):
+        self.offset = (page - 1) * per_page
+        self.ids, self.total = search_products(
+            query, offset=self.offset, limit=per_page, filters=filters
+        )
+        self.queryset = queryset
 
+    def count(self):
+        return self.total
 
-def index_products(docs=None):
-    """Index all the products"""
-    products = Product.objects.filter(
-        in_stock__gt=0, 
-        is_available=True
-    ).select_related('category')
-    docs = docs or [d.dict() for d in products]
-    # docs = docs or [d.dict() for d in Product.objects.all()]
+    def __len__(self):
+        return self.total
 
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("SearchResults only supports slicing")
+        if (key.start or 0) != self.offset:
+            # only the page requested in get_queryset was fetched
+            return []
+        position = {id: i for i, id in enumerate(self.ids)}
+        products = list(self.queryset.filter(id__in=self.ids))
+        products.sort(key=lambda p: position[str(p.id)])
+        return products
+
+
+def iter_product_docs(batch_size):
+    """Yield lists of at most batch_size documents, streaming from the db"""
+    products = (
+        Product.objects.available()
+        .select_related("category")
+        .iterator(chunk_size=batch_size)
+    )
+    batch = []
+    for product in products:
+        batch.append(product.dict())
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def index_products(docs=None, batch_size=None, wait=False):
+    """
+    Index all the products in batches. Returns the Meilisearch task ids,
+    and when `wait` is set, blocks until they are processed.
+    """
+    batch_size = batch_size or settings.MEILISEARCH_BATCH_SIZE
+    batches = [docs] if docs else iter_product_docs(batch_size)
+
+    backend = get_search_backend()
+    start = time.perf_counter()
+    task_uids = []
+    documents = 0
     logger.info("indexing...")
-    result = search_index.add_documents(docs)
+    for batch in batches:
+        task_uid = backend.add_documents(batch)
+        task_uids.append(task_uid)
+        documents += len(batch)
+        logger.info("queued %s documents (task %s)", len(batch), task_uid)
 
     logger.info("setting up filter & sort attributes...")
-    setup_attributes()
+    task_uids.append(setup_attributes())
+    task_uids = [uid for uid in task_uids if uid is not None]
+
+    if wait:
+        failed = backend.wait_for_tasks(task_uids)
+        if failed:
+            logger.error("indexing tasks failed: %s", failed)
 
-    logger.info("done")
-    return result
+    bump_catalog_version()
+    logger.info(
+        "done: %s documents in %s tasks, %.2fs",
+        documents, len(task_uids), time.perf_counter() - start,
+    )
+    return task_uids
 
 
 def clear_index():
-    search_index.delete_all_documents()
\ No newline at end of file
+    get_search_backend().clear()
+    bump_catalog_version()
+
+
+def queue_products_for_index(product_ids):
+    """
+    Add changed products to the search outbox and schedule one debounced
+    sync task for everything that changes within SEARCH_SYNC_DELAY seconds.
+    """
+    from apps.shop.tasks import sync_search_index
+
+    product_ids = [str(id) for id in product_ids]
+    if not product_ids:
+        return
+
+    r = get_redis()
+    r.sadd(OUTBOX_KEY, *product_ids)
+    delay = settings.SEARCH_SYNC_DELAY
+    if r.set(OUTBOX_SCHEDULED_KEY, 1, nx=True, ex=delay + 60):
+        try:
+            sync_search_index.apply_async(countdown=delay, retry=False)
+        except Exception:
+            # ids stay in the outbox and go out with the next scheduled sync
+            r.delete(OUTBOX_SCHEDULED_KEY)
+            logger.warning("could not schedule search sync", exc_info=True)
+
+
+def queue_for_index(product_ids):
+    """
+    Queue search document updates once the current transaction commits,
+    and drop the cached catalog pages and cards that show these products.
+    Call it after changes that send no model signals, like .update().
+    """
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: queue_products_for_index(product_ids))
+    transaction.on_commit(bump_catalog_cache)
+    transaction.on_commit(lambda: bump_product_cards(product_ids))
+
+
+def sync_index_outbox(batch_size=None):
+    """
+    Drain the search outbox: upsert documents of available products and
+    delete the rest. Returns (documents updated, documents deleted).
+    """
+    batch_size = batch_size or settings.MEILISEARCH_BATCH_SIZE
+    r = get_redis()
+    # changes made from now on schedule a new run
+    r.delete(OUTBOX_SCHEDULED_KEY)
+
+    updated = deleted = 0
+    while True:
+        ids = r.spop(OUTBOX_KEY, batch_size)
+        if not ids:
+            break
+        try:
+            products = (
+                Product.objects.available()
+                .filter(id__in=ids)
+                .select_related("category")
+            )
+            docs = [product.dict() for product in products]
+            if docs:
+                get_search_backend().update_documents(docs)
+            gone = list(set(ids) - {doc["id"] for doc in docs})
+            if gone:
+                get_search_backend().delete_documents(gone)
+        except Exception:
+            r.sadd(OUTBOX_KEY, *ids)  # put them back for the retry
+            raise
+        updated += len(docs)
+        deleted += len(gone)
+
+    if updated or deleted:
+        bump_catalog_version()
+    return updated, deleted
@@ -0,0 +1,121 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+CATALOG_CACHE_VERSION_KEY = "catalog:pages:version"
+CATALOG_PAGE_PREFIX = "catalog:page"
+PRODUCT_CARD_VERSION_PREFIX = "product:card:version"
+PRODUCT_CARD_PREFIX = "product:card"
+
+
+def catalog_cache_version():
+    return cache.get(CATALOG_CACHE_VERSION_KEY, 0)
+
+
+def bump_catalog_cache():
+    """Orphan every cached catalog page, they expire on their own."""
+    try:
+        cache.incr(CATALOG_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_CACHE_VERSION_KEY, 1, timeout=None)
+
+
+def page_cache_key(request):
+    # sorted so ?page=2&filter=x and ?filter=x&page=2 share an entry
+    query = sorted(request.GET.lists())
+    variant = "htmx" if request.headers.get("HX-Request") else "full"
+    raw = f"{request.path}|{query}|{variant}"
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    return f"{CATALOG_PAGE_PREFIX}:{catalog_cache_version()}:{digest}"
+
+
+def is_cacheable(request):
+    """
+    Only anonymous GETs without pending messages render the same for
+    everyone. Search pages are left out.
+    """
+    if request.method not in ("GET", "HEAD") or request.user.is_authenticated:
+        return False
+    if "sweetify" in request.session:
+        return False
+    if request.GET.get("q"):
+        # search results are cached per catalog version by the search itself,
+        # a page cached here could outlive the index sync that follows a change
+        return False
+    return not len(get_messages(request))
+
+
+def cache_catalog_page(view_func):
+    """
+    Cache the whole response of a catalog view for anonymous visitors.
+    Entries are keyed on the catalog version, so a product, category or
+    review change (see apps.shop.signals) invalidates all of them at once.
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable(request):
+            return view_func(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        response = cache.get(key)
+        if response is not None:
+            return response
+
+        response = view_func(request, *args, **kwargs)
+        patch_vary_headers(response, ["HX-Request"])
+        if response.status_code != 200 or response.cookies:
+            return response
+
+        def store(response):
+            cache.set(key, response, settings.CATALOG_CACHE_TIMEOUT)
+
+        if hasattr(response, "render") and not response.is_rendered:
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
+
+    return wrapper
+
+
+def product_card_version_key(product_id):
+    return f"{PRODUCT_CARD_VERSION_PREFIX}:{product_id}"
+
+
+def bump_product_cards(product_ids):
+    """Give the products a new card version, their cached cards are orphaned."""
+    version = time.time_ns()
+    cache.set_many(
+        {product_card_version_key(id): version for id in product_ids}, timeout=None
+    )
+
+
+def get_product_cards(products, variant):
+    """
+    Return ({product id: cached card html}, {product id: card cache key}),
+    the keys are needed to store the cards that were missing.
+    """
+    if not products:
+        return {}, {}
+    versions = cache.get_many([product_card_version_key(p.pk) for p in products])
+    keys = {
+        p.pk: f"{PRODUCT_CARD_PREFIX}:{p.pk}:"
+        f"{versions.get(product_card_version_key(p.pk), 0)}:{variant}"
+        for p in products
+    }
+    cached = cache.get_many(keys.values())
+    return {id: cached[key] for id, key in keys.items() if key in cached}, keys
+
+
+def set_product_cards(cards, keys):
+    """Cache rendered cards, `cards` maps product id -> html."""
+    cache.set_many(
+        {keys[id]: html for id, html in cards.items()},
+        settings.PRODUCT_CARD_CACHE_TIMEOUT,
+    )
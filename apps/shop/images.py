@@ -0,0 +1,64 @@
+from functools import lru_cache
+
+from cloudinary import CloudinaryImage
+
+# the image sizes the templates use, named so a URL can be cached per public_id
+IMAGE_SIZES = {
+    "card": {"width": 400, "crop": "limit", "quality": "auto", "fetch_format": "auto"},
+    "thumbnail": {
+        "width": 250,
+        "height": 250,
+        "crop": "fill",
+        "gravity": "auto",
+        "quality": "auto",
+        "fetch_format": "auto",
+    },
+    "detail": {"width": 800, "crop": "limit", "quality": "auto", "fetch_format": "auto"},
+}
+
+# responsive widths offered in the srcset of each size
+SRCSET_WIDTHS = {
+    "card": (200, 400, 600),
+    "thumbnail": (250, 500),
+    "detail": (400, 800, 1200),
+}
+
+
+def _scaled(size, width):
+    """The transformation of `size` at `width`, keeping a fixed aspect ratio."""
+    options = dict(IMAGE_SIZES[size])
+    if "height" in options:
+        options["height"] = round(options["height"] * width / options["width"])
+    options["width"] = width
+    return options
+
+
+@lru_cache(maxsize=4096)
+def image_url(public_id, size):
+    """
+    URL of the image at one of IMAGE_SIZES. Building it signs and formats
+    strings, so each (public_id, size) is built once per process.
+    """
+    if not public_id:
+        return ""
+    return CloudinaryImage(public_id).build_url(**IMAGE_SIZES[size])
+
+
+@lru_cache(maxsize=4096)
+def image_srcset(public_id, size):
+    if not public_id:
+        return ""
+    image = CloudinaryImage(public_id)
+    return ", ".join(
+        f"{image.build_url(**_scaled(size, width))} {width}w"
+        for width in SRCSET_WIDTHS[size]
+    )
+
+
+@lru_cache(maxsize=4096)
+def cropped_image_url(public_id, width, height):
+    """URL of the image filled into width x height, for crops outside IMAGE_SIZES."""
+    if not public_id:
+        return ""
+    options = dict(IMAGE_SIZES["thumbnail"], width=width, height=height)
+    return CloudinaryImage(public_id).build_url(**options)
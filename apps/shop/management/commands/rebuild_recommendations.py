@@ -0,0 +1,44 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from apps.orders.models import OrderItem
+from apps.shop.recommender import Recommender
+
+class Command(BaseCommand):
+    help = 'Rebuild the bought-together sets from paid orders (e.g. after a Redis flush)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Orders per Redis pipeline')
+        parser.add_argument('--clear', action='store_true', help='Delete the existing sets first')
+
+    def handle(self, *args, **options):
+        r = Recommender()
+        chunk_size = options['chunk_size']
+
+        if options['clear']:
+            self.stdout.write('Clearing existing bought-together sets...')
+            keys = list(r.r.scan_iter(match=r.get_product_key('*'), count=1000))
+            for i in range(0, len(keys), 1000):
+                r.r.delete(*keys[i:i + 1000])
+
+        items = (
+            OrderItem.objects.filter(order__paid=True)
+            .order_by('order_id')
+            .values_list('order_id', 'product_id')
+            .iterator(chunk_size=chunk_size * 10)
+        )
+
+        chunk = []
+        total = 0
+        for _, rows in groupby(items, key=lambda row: row[0]):
+            chunk.append([product_id for _, product_id in rows])
+            if len(chunk) >= chunk_size:
+                r.add_purchases(chunk)
+                total += len(chunk)
+                chunk = []
+                self.stdout.write(f'{total} orders processed')
+        if chunk:
+            r.add_purchases(chunk)
+            total += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt recommendations from {total} orders'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from apps.shop.recommender import Recommender
+
+class Command(BaseCommand):
+    help = 'Report Redis memory used by the bought-together sets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Number of largest sets to list')
+
+    def handle(self, *args, **options):
+        report = Recommender().memory_report(top=options['top'])
+        self.stdout.write(f"Sets: {report['keys']}")
+        self.stdout.write(f"Total: {report['bytes'] / 1024:.1f} KiB (avg {report['avg_bytes']} bytes per set)")
+        self.stdout.write(f"Largest cardinality: {report['max_cardinality']}")
+        for key, memory, cardinality in report['largest']:
+            self.stdout.write(f"  {key}: {memory} bytes, {cardinality} products")
@@ -1,11 +1,20 @@
+import time
+
 from django.core.management.base import BaseCommand
-from apps.shop.business_logic import setup_attributes, index_products
+from apps.shop.business_logic import index_products
 
 class Command(BaseCommand):
     help = 'Setup Meilisearch index and attributes'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Documents sent per request')
+        parser.add_argument('--wait', action='store_true', help='Wait for Meilisearch to finish indexing')
+
     def handle(self, *args, **kwargs):
         self.stdout.write('Setting up Meilisearch index...')
-        setup_attributes()
-        index_products()
-        self.stdout.write(self.style.SUCCESS('Successfully set up Meilisearch index'))
\ No newline at end of file
+        start = time.perf_counter()
+        task_uids = index_products(batch_size=kwargs['batch_size'], wait=kwargs['wait'])
+        self.stdout.write(f'Meilisearch tasks: {", ".join(str(uid) for uid in task_uids)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully set up Meilisearch index in {time.perf_counter() - start:.2f}s'
+        ))
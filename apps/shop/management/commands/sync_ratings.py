@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from apps.shop.models import Product
+
+class Command(BaseCommand):
+    help = 'Backfill or reconcile the stored review summary on every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.stdout.write('Reconciling product ratings...')
+        fixed = Product.objects.sync_rating_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated rating summary on {fixed} products'))
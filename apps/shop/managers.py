@@ -1,15 +1,87 @@
 from django.db import models
+from django.db.models import Avg, Count, F, Q, Sum
+from django.db.models.functions import Coalesce
 
+RATING_STARS = range(1, 6)
 
-class ProductManager(models.Manager):
+
+class ProductQuerySet(models.QuerySet):
     def available(self):
         """
-        Return products that are in stock and available.
+        Return products that are in stock and available. in_stock is the
+        quantity left to sell, units held for unpaid orders are already
+        taken out of it (see apps.orders.business_logic).
+        """
+        return self.filter(in_stock__gt=0, is_available=True)
+
+    def with_rating_stats(self):
+        """
+        Annotate review count and average rating in the same query.
+        Product.num_of_reviews and Product.avg_rating prefer these values.
         """
-        return self.get_queryset().filter(in_stock__gt=0, is_available=True)
-    
+        return self.annotate(
+            review_count=Count("reviews"),
+            review_avg=Avg("reviews__rating"),
+        )
+
+
+class ProductManager(models.Manager.from_queryset(ProductQuerySet)):
     def get_index_objects(self):
         """Objects formatted for indexing"""
         # Filter for available products before converting to dict
-        available_products = self.available()
-        return [h.dict() for h in available_products]
\ No newline at end of file
+        available_products = self.available().select_related("category")
+        return [h.dict() for h in available_products]
+
+    def adjust_rating_stats(self, product_id, rating, delta):
+        """
+        Add (delta=1) or remove (delta=-1) a single review rating
+        from a product's stored review summary in one UPDATE.
+        """
+        return self.get_queryset().filter(pk=product_id).update(
+            rating_count=F("rating_count") + delta,
+            rating_sum=F("rating_sum") + rating * delta,
+            **{f"rating_{rating}": F(f"rating_{rating}") + delta},
+        )
+
+    def sync_rating_stats(self, batch_size=500):
+        """
+        Recompute every product's stored review summary from the reviews
+        table and save the ones that drifted. Returns the number fixed.
+        """
+        fields = ["rating_count", "rating_sum"] + [f"rating_{s}" for s in RATING_STARS]
+        products = (
+            self.get_queryset()
+            .only("id", *fields)
+            .annotate(
+                actual_count=Count("reviews"),
+                actual_sum=Coalesce(Sum("reviews__rating"), 0),
+                **{
+                    f"actual_{s}": Count("reviews", filter=Q(reviews__rating=s))
+                    for s in RATING_STARS
+                },
+            )
+            .order_by()
+        )
+
+        stale = []
+        fixed = 0
+        for product in products.iterator(chunk_size=batch_size):
+            actual = {
+                "rating_count": product.actual_count,
+                "rating_sum": product.actual_sum,
+                **{f"rating_{s}": getattr(product, f"actual_{s}") for s in RATING_STARS},
+            }
+            if all(getattr(product, k) == v for k, v in actual.items()):
+                continue
+            for k, v in actual.items():
+                setattr(product, k, v)
+            stale.append(product)
+            if len(stale) >= batch_size:
+                self.bulk_update(stale, fields)
+                fixed += len(stale)
+                stale = []
+
+        if stale:
+            self.bulk_update(stale, fields)
+            fixed += len(stale)
+        return fixed
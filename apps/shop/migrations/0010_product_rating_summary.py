@@ -0,0 +1,69 @@
+# Generated by Django 5.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_summary(apps, schema_editor):
+    Product = apps.get_model("shop", "Product")
+    products = Product.objects.annotate(
+        actual_count=Count("reviews"),
+        actual_sum=Coalesce(Sum("reviews__rating"), 0),
+        **{
+            f"actual_{s}": Count("reviews", filter=Q(reviews__rating=s))
+            for s in range(1, 6)
+        },
+    ).filter(actual_count__gt=0)
+    for product in products.iterator():
+        Product.objects.filter(pk=product.pk).update(
+            rating_count=product.actual_count,
+            rating_sum=product.actual_sum,
+            **{f"rating_{s}": getattr(product, f"actual_{s}") for s in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_alter_review_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_summary, migrations.RunPython.noop),
+    ]
@@ -5,13 +5,12 @@ from django.urls import reverse
 from apps.profiles.models import Profile
 from apps.common.models import BaseModel
 from django.utils.translation import gettext_lazy as _
-from statistics import mean
 
 from apps.common.validators import validate_file_size
 
 from cloudinary.models import CloudinaryField
-from cloudinary import CloudinaryImage
 
+from apps.shop.images import IMAGE_SIZES, cropped_image_url, image_srcset, image_url
 from apps.shop.managers import ProductManager
 
 
@@ -49,6 +48,15 @@ class Product(BaseModel):
     flash_deals = models.BooleanField(default=False)
     image = CloudinaryField("image", folder="products/")
 
+    # denormalized review summary, kept in sync by apps.shop.signals
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
     objects = ProductManager()
 
     def dict(self):
@@ -58,39 +66,45 @@ class Product(BaseModel):
             "name": self.name,
             "description": self.description,
             "category": self.category.name if self.category else None,
+            "category_slug": self.category.slug if self.category else None,
             "price": float(self.price),
             "in_stock": self.in_stock,
             "featured": self.featured,
             "flash_deals": self.flash_deals,
-            "image_url": self.image_url,  # TODO: FIND A WAY AROUND IT
+            "image_url": self.card_image_url,
             "num_of_reviews": self.num_of_reviews,
             "avg_rating": self.avg_rating,
             "get_absolute_url": self.get_absolute_url,
         }
 
     def get_cropped_image_url(self, width=250, height=250):
-        # Generate a cropped image URL using Cloudinary transformations
-        return CloudinaryImage(self.image.public_id).build_url(
-            width=width,
-            height=height,
-            crop="fill",
-            gravity="auto",
-        )
+        for size, options in IMAGE_SIZES.items():
+            if (options["width"], options.get("height")) == (width, height):
+                return image_url(self.image_public_id, size)
+        return cropped_image_url(self.image_public_id, width, height)
 
     def __str__(self):
         return self.name
 
     @property
     def num_of_reviews(self):
-        return self.reviews.count()
+        # annotated by ProductQuerySet.with_rating_stats()
+        if hasattr(self, "review_count"):
+            return self.review_count
+        return self.rating_count
 
     @property
     def avg_rating(self):
-        reviews = [review.rating for review in self.reviews.all()]
-        avg = 0
-        if len(reviews) > 0:
-            avg = round(mean(list(reviews)))  # Mean
-        return avg
+        if hasattr(self, "review_avg"):
+            return round(self.review_avg or 0)
+        if not self.rating_count:
+            return 0
+        return round(self.rating_sum / self.rating_count)
+
+    @property
+    def rating_histogram(self):
+        """Number of reviews per star, keyed 1 to 5."""
+        return {star: getattr(self, f"rating_{star}") for star in range(1, 6)}
 
     @property
     def get_absolute_url(self):
@@ -100,6 +114,31 @@ class Product(BaseModel):
     def image_url(self):
         return self.image.url
 
+    @property
+    def image_public_id(self):
+        # a freshly assigned image is still a plain string
+        return getattr(self.image, "public_id", self.image)
+
+    @property
+    def card_image_url(self):
+        return image_url(self.image_public_id, "card")
+
+    @property
+    def card_image_srcset(self):
+        return image_srcset(self.image_public_id, "card")
+
+    @property
+    def thumbnail_url(self):
+        return image_url(self.image_public_id, "thumbnail")
+
+    @property
+    def detail_image_url(self):
+        return image_url(self.image_public_id, "detail")
+
+    @property
+    def detail_image_srcset(self):
+        return image_srcset(self.image_public_id, "detail")
+
     # @property
     # def image_url(self): #FIXME
     #     try:
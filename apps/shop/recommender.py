@@ -1,54 +1,236 @@
-import redis
-from django.conf import settings
+import hashlib
+import json
 from uuid import UUID
+from django.conf import settings
+from apps.common.redis_client import get_redis
 from .models import Product
 
-# connect to redis
-r = redis.Redis(
-    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
-)
+CART_SIGNATURES_KEY = "recommendations:cart_signatures"  # signature -> times viewed
+CART_SIGNATURE_IDS_KEY = "recommendations:cart_signature_ids"  # signature -> product ids
 
 
 class Recommender:
+    def __init__(self):
+        self.r = get_redis()
+
     def get_product_key(self, id):
         return f"product:{id}:purchased_with"
 
+    def get_suggestions_key(self, id):
+        return f"product:{id}:suggestions"
+
+    def get_cart_signature(self, product_ids):
+        flat_ids = ",".join(sorted(product_ids))
+        return hashlib.sha1(flat_ids.encode("utf-8")).hexdigest()
+
+    def get_cart_suggestions_key(self, signature):
+        return f"recommendations:cart:{signature}"
+
     def products_bought(self, products):
-        product_ids = [str(p.id) for p in products]
-        print("Product IDs:", product_ids)
-        for product_id in product_ids:
-            print("Product IDs:", product_id)
-            for with_id in product_ids:
-                print("With IDs:", with_id)
-                # get the other products bought with each product
-                if product_id != with_id:
-                    # increment score for product purchased together
-                    r.zincrby(str(self.get_product_key(product_id)), 1, with_id)
+        self.add_purchases([[str(p.id) for p in products]])
+
+    def add_purchases(self, orders):
+        """
+        Increment the bought-together scores for many orders at once.
+        `orders` is an iterable of product id lists; all pair updates are
+        sent in a single pipeline round trip.
+        """
+        pipe = self.r.pipeline(transaction=False)
+        touched = set()
+        for product_ids in orders:
+            product_ids = list(dict.fromkeys(str(id) for id in product_ids))
+            for product_id in product_ids:
+                for with_id in product_ids:
+                    # get the other products bought with each product
+                    if product_id != with_id:
+                        # increment score for product purchased together
+                        pipe.zincrby(self.get_product_key(product_id), 1, with_id)
+                        touched.add(self.get_product_key(product_id))
+        for key in touched:
+            self._cap(pipe, key)
+        pipe.execute()
+
+    def _cap(self, pipe, key):
+        # keep only the highest scored products so each set stays bounded
+        pipe.zremrangebyrank(key, 0, -(settings.RECOMMENDATIONS_MAX_RELATED + 1))
+
+    def decay(self, factor=None, min_score=None, batch_size=500):
+        """
+        Multiply every bought-together score by `factor` so that old
+        purchases count less than recent ones, dropping scores that fall
+        below `min_score` and capping each set. Returns the sets processed.
+        """
+        factor = factor if factor is not None else settings.RECOMMENDATIONS_DECAY_FACTOR
+        min_score = (
+            min_score if min_score is not None else settings.RECOMMENDATIONS_MIN_SCORE
+        )
+        processed = 0
+        pipe = self.r.pipeline(transaction=False)
+        for key in self.r.scan_iter(match=self.get_product_key("*"), count=batch_size):
+            # scale the set in place on the server
+            pipe.zunionstore(key, {key: factor})
+            pipe.zremrangebyscore(key, "-inf", f"({min_score}")
+            self._cap(pipe, key)
+            processed += 1
+            if processed % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+        return processed
+
+    def memory_report(self, top=10, batch_size=500):
+        """Memory used by the bought-together sets, with the largest ones."""
+        sizes = []
+        keys = []
+        pipe = self.r.pipeline(transaction=False)
+        for key in self.r.scan_iter(match=self.get_product_key("*"), count=batch_size):
+            keys.append(key)
+            pipe.memory_usage(key)
+            pipe.zcard(key)
+            if len(keys) >= batch_size:
+                results = pipe.execute()
+                sizes += zip(keys, results[::2], results[1::2])
+                keys = []
+        if keys:
+            results = pipe.execute()
+            sizes += zip(keys, results[::2], results[1::2])
+
+        total = sum(memory or 0 for _, memory, _ in sizes)
+        return {
+            "keys": len(sizes),
+            "bytes": total,
+            "avg_bytes": total // len(sizes) if sizes else 0,
+            "max_cardinality": max((card for _, _, card in sizes), default=0),
+            "largest": sorted(sizes, key=lambda x: x[1] or 0, reverse=True)[:top],
+        }
 
     def suggest_products_for(self, products, max_results=6):
+        """
+        Read precomputed suggestions (see refresh_product_suggestions and
+        refresh_cart_suggestions) in a single pipeline round trip.
+        """
         product_ids = [str(p.id) for p in products]
-        if len(products) == 1:
+        pipe = self.r.pipeline(transaction=False)
+        if len(product_ids) == 1:
             # only 1 product
-            suggestions = r.zrange(
-                self.get_product_key(product_ids[0]), 0, -1, desc=True
-            )[:max_results]
+            pipe.get(self.get_suggestions_key(product_ids[0]))
+            cached, = pipe.execute()
+            if cached is None:
+                scored = self.refresh_product_suggestions(product_ids)[product_ids[0]]
+            else:
+                scored = json.loads(cached)
         else:
-            # generate a temporary key
-            flat_ids = "".join(id for id in product_ids)  # uuid1uuid2uuid3
-            tmp_key = f"tmp_{flat_ids}"  # tmp_uuid1uuid2uuid3
-            # multiple products, combine scores of all products
-            # store the resulting sorted set in a temporary key
-            keys = [self.get_product_key(id) for id in product_ids]
-            r.zunionstore(tmp_key, keys)
-            # remove ids for the products the recommendation is for
-            r.zrem(tmp_key, *product_ids)
-            # get the product ids by their score, descendant sort
-            suggestions = r.zrange(tmp_key, 0, -1, desc=True)[:max_results]
-            # remove the temporary key
-            r.delete(tmp_key)
-
-        suggested_product_ids = [UUID(id.decode("utf-8")) for id in suggestions]
-        # get suggested products and sort by order of appearanc
-        suggested_products = list(Product.objects.filter(id__in=suggested_product_ids))
-        suggested_products.sort(key=lambda x: suggested_product_ids.index(x.id))
+            # multiple products, look up this exact cart and, as a fallback,
+            # the suggestions of each product in it
+            signature = self.get_cart_signature(product_ids)
+            pipe.get(self.get_cart_suggestions_key(signature))
+            pipe.mget([self.get_suggestions_key(id) for id in product_ids])
+            # remember the cart so the refresh task can precompute it
+            pipe.zincrby(CART_SIGNATURES_KEY, 1, signature)
+            pipe.hset(CART_SIGNATURE_IDS_KEY, signature, ",".join(product_ids))
+            cached, per_product, _, _ = pipe.execute()
+            if cached is not None:
+                scored = json.loads(cached)
+            else:
+                scored = self._merge_suggestions(product_ids, per_product)
+
+        suggested_product_ids = [UUID(id) for id, _ in scored[:max_results]]
+        # get suggested products and sort by order of appearance
+        position = {id: i for i, id in enumerate(suggested_product_ids)}
+        suggested_products = list(
+            Product.objects.filter(id__in=suggested_product_ids).with_rating_stats()
+        )
+        suggested_products.sort(key=lambda x: position[x.id])
         return suggested_products
+
+    def _merge_suggestions(self, product_ids, per_product):
+        """Approximate a cart's suggestions by summing its products' top lists."""
+        missing = [id for id, cached in zip(product_ids, per_product) if cached is None]
+        computed = self.refresh_product_suggestions(missing) if missing else {}
+
+        scores = {}
+        for id, cached in zip(product_ids, per_product):
+            scored = json.loads(cached) if cached is not None else computed[id]
+            for with_id, score in scored:
+                scores[with_id] = scores.get(with_id, 0) + score
+        for id in product_ids:
+            # remove ids for the products the recommendation is for
+            scores.pop(id, None)
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+    def refresh_product_suggestions(self, product_ids):
+        """
+        Materialize the top-N co-purchased products for each product id.
+        Returns {product_id: [[id, score], ...]}.
+        """
+        size = settings.RECOMMENDATIONS_SIZE
+        pipe = self.r.pipeline(transaction=False)
+        for id in product_ids:
+            pipe.zrange(self.get_product_key(id), 0, size - 1, desc=True, withscores=True)
+        results = dict(zip(product_ids, pipe.execute()))
+
+        for id, scored in results.items():
+            pipe.set(
+                self.get_suggestions_key(id),
+                json.dumps(scored),
+                ex=settings.RECOMMENDATIONS_TTL,
+            )
+        pipe.execute()
+        return {id: [list(pair) for pair in scored] for id, scored in results.items()}
+
+    def refresh_cart_suggestions(self, product_ids):
+        """Materialize the exact combined suggestions for one cart."""
+        signature = self.get_cart_signature(product_ids)
+        tmp_key = f"tmp_{signature}"
+        size = settings.RECOMMENDATIONS_SIZE
+        keys = [self.get_product_key(id) for id in product_ids]
+
+        pipe = self.r.pipeline()
+        # combine scores of all products into a temporary sorted set
+        pipe.zunionstore(tmp_key, keys)
+        # remove ids for the products the recommendation is for
+        pipe.zrem(tmp_key, *product_ids)
+        pipe.zrange(tmp_key, 0, size - 1, desc=True, withscores=True)
+        pipe.delete(tmp_key)
+        scored = pipe.execute()[2]
+
+        self.r.set(
+            self.get_cart_suggestions_key(signature),
+            json.dumps(scored),
+            ex=settings.RECOMMENDATIONS_TTL,
+        )
+        return scored
+
+    def refresh_all(self, batch_size=500):
+        """
+        Refresh every product's suggestions and those of the most viewed
+        carts. Returns (products refreshed, carts refreshed).
+        """
+        batch = []
+        products = 0
+        for key in self.r.scan_iter(match=self.get_product_key("*"), count=batch_size):
+            batch.append(key.split(":")[1])
+            if len(batch) >= batch_size:
+                self.refresh_product_suggestions(batch)
+                products += len(batch)
+                batch = []
+        if batch:
+            self.refresh_product_suggestions(batch)
+            products += len(batch)
+
+        # keep only the most common carts, forget the long tail
+        keep = settings.RECOMMENDATIONS_CART_SIGNATURES
+        dropped = self.r.zrange(CART_SIGNATURES_KEY, 0, -(keep + 1))
+        if dropped:
+            pipe = self.r.pipeline()
+            pipe.zrem(CART_SIGNATURES_KEY, *dropped)
+            pipe.hdel(CART_SIGNATURE_IDS_KEY, *dropped)
+            pipe.execute()
+
+        signatures = self.r.zrange(CART_SIGNATURES_KEY, 0, -1, desc=True)
+        carts = 0
+        if signatures:
+            for ids in self.r.hmget(CART_SIGNATURE_IDS_KEY, signatures):
+                if ids:
+                    self.refresh_cart_suggestions(ids.split(","))
+                    carts += 1
+        return products, carts
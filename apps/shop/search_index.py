@@ -1,8 +1,38 @@
+import bisect
+import itertools
+import logging
+import re
+import threading
+import time
+
 import meilisearch
-from decouple import config
+from decouple import UndefinedValueError, config
+from django.conf import settings
+from django.utils.module_loading import import_string
+from meilisearch.errors import MeilisearchError
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_backends = {}
+
+
+class SearchBackendError(Exception):
+    """The search engine could not be reached or rejected the request."""
+
+
+def get_client():
+    """Return the process-wide Meilisearch client (keeps its HTTP session)."""
+    global _client
+    if _client is None:
+        try:
+            _client = meilisearch.Client(
+                config("MEILISEARCH_URL"), config("MEILISEARCH_MASTER_KEY")
+            )
+        except UndefinedValueError as e:
+            raise SearchBackendError(str(e)) from e
+    return _client
 
-MEILISEARCH_URL = config("MEILISEARCH_URL")
-MEILISEARCH_API_TOKEN = config("MEILISEARCH_MASTER_KEY")     
 
 class SearchIndex:
     index = None
@@ -17,23 +47,273 @@ class SearchIndex:
 
     def get_index(self):
         """Retrieve index"""
-        client = meilisearch.Client(
-            MEILISEARCH_URL, MEILISEARCH_API_TOKEN
-        )
-        return client.index(self.index)
+        return get_client().index(self.index)
 
     def delete_doc(self, doc):
         self.get_index().delete_document(doc)
 
+    def delete_docs(self, docs):
+        return self.get_index().delete_documents(docs)
+
     def clear_index(self):
-        self.get_index().delete_all_documents()
+        return self.get_index().delete_all_documents()
+
+
+class BaseSearchBackend:
+    """
+    Interface of the product search engines. `filters` is a dict of
+    document attribute -> required value, e.g. {"featured": True}.
+    Write methods return an engine task id, or None when applied at once.
+    """
+
+    def search(self, query, offset=0, limit=20, filters=None):
+        """Return (matching document ids in rank order, estimated total)."""
+        raise NotImplementedError
+
+    def setup(self, searchable, filterable):
+        raise NotImplementedError
+
+    def add_documents(self, docs):
+        raise NotImplementedError
+
+    def update_documents(self, docs):
+        raise NotImplementedError
+
+    def delete_documents(self, ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def wait_for_tasks(self, task_uids):
+        """Block until the given tasks are processed, return the failed ones."""
+        return []
+
+
+class MeilisearchBackend(BaseSearchBackend):
+    def __init__(self):
+        self.search_index = SearchIndex()
+
+    def _call(self, method, *args):
+        try:
+            return getattr(self.search_index.get_index(), method)(*args)
+        except MeilisearchError as e:
+            raise SearchBackendError(str(e)) from e
+
+    def search(self, query, offset=0, limit=20, filters=None):
+        params = {"offset": offset, "limit": limit, "attributesToRetrieve": ["id"]}
+        if filters:
+            params["filter"] = [
+                f'{name} = "{value}"' if isinstance(value, str)
+                else f"{name} = {str(value).lower()}"
+                for name, value in filters.items()
+            ]
+        results = self._call("search", query, params)
+        ids = [hit["id"] for hit in results.get("hits", [])]
+        return ids, results.get("estimatedTotalHits", len(ids))
+
+    def setup(self, searchable, filterable):
+        return self._call(
+            "update_settings",
+            {"searchableAttributes": searchable, "filterableAttributes": filterable},
+        ).task_uid
+
+    def add_documents(self, docs):
+        return self._call("add_documents", docs).task_uid
+
+    def update_documents(self, docs):
+        return self._call("update_documents", docs).task_uid
+
+    def delete_documents(self, ids):
+        try:
+            return self.search_index.delete_docs(ids).task_uid
+        except MeilisearchError as e:
+            raise SearchBackendError(str(e)) from e
+
+    def clear(self):
+        try:
+            return self.search_index.clear_index().task_uid
+        except MeilisearchError as e:
+            raise SearchBackendError(str(e)) from e
+
+    def wait_for_tasks(self, task_uids):
+        timeout = settings.MEILISEARCH_TASK_TIMEOUT_MS
+        try:
+            tasks = [
+                get_client().wait_for_task(uid, timeout_in_ms=timeout)
+                for uid in task_uids
+            ]
+        except MeilisearchError as e:
+            raise SearchBackendError(str(e)) from e
+        return [task.uid for task in tasks if task.status != "succeeded"]
+
+
+def tokenize(text):
+    return re.findall(r"\w+", (text or "").lower())
+
 
+class LocalIndex:
+    """
+    Immutable snapshot of the local inverted index. Updates return a new
+    snapshot so that searches running in other threads never see a half
+    applied change.
+    """
+
+    # a match in the name ranks above a match in the description
+    FIELD_WEIGHTS = {"name": 2, "description": 1}
+
+    def __init__(self, docs=None, postings=None, terms=None):
+        self.docs = docs or {}
+        self.postings = postings or {}  # token -> {doc id: weight}
+        # sorted vocabulary for prefix lookups
+        self.terms = sorted(self.postings) if terms is None else terms
+
+    def _tokens(self, doc):
+        for field, weight in self.FIELD_WEIGHTS.items():
+            for token in tokenize(doc.get(field)):
+                yield token, weight
+
+    def updated(self, add=(), remove=()):
+        """Return a copy with the `remove` ids dropped and the `add` docs (re)indexed."""
+        docs = dict(self.docs)
+        postings = dict(self.postings)
+        copied = set()  # tokens whose postings were copied from this snapshot
+
+        def postings_for(token):
+            if token not in copied:
+                copied.add(token)
+                if token in postings:
+                    postings[token] = dict(postings[token])
+            return postings.setdefault(token, {})
+
+        for id in itertools.chain(remove, (doc["id"] for doc in add)):
+            doc = docs.pop(id, None)
+            if doc is None:
+                continue
+            for token, _ in self._tokens(doc):
+                token_postings = postings_for(token)
+                token_postings.pop(id, None)
+                if not token_postings:
+                    del postings[token]
+
+        for doc in add:
+            docs[doc["id"]] = doc
+            for token, weight in self._tokens(doc):
+                token_postings = postings_for(token)
+                token_postings[doc["id"]] = max(token_postings.get(doc["id"], 0), weight)
+
+        terms = self.terms if postings.keys() == self.postings.keys() else None
+        return LocalIndex(docs, postings, terms)
+
+    def match(self, token, prefix):
+        """Documents containing `token` (or, for the last word, a token starting with it)."""
+        if not prefix:
+            return self.postings.get(token, {})
+        matches = {}
+        for i in range(bisect.bisect_left(self.terms, token), len(self.terms)):
+            indexed = self.terms[i]
+            if not indexed.startswith(token):
+                break
+            for id, weight in self.postings[indexed].items():
+                matches[id] = max(matches.get(id, 0), weight)
+        return matches
+
+
+class LocalSearchBackend(BaseSearchBackend):
+    """
+    In-process inverted index over product name and description, built
+    from ProductManager.get_index_objects(). Needs no external service and
+    is rebuilt every LOCAL_SEARCH_REFRESH seconds so that every process
+    eventually sees catalog changes made elsewhere.
+    """
+
+    def __init__(self):
+        self.index = LocalIndex()
+        self.built_at = None
+        # serializes rebuilds and writes; searches read self.index unlocked
+        self._lock = threading.Lock()
+
+    def _is_stale(self):
+        refresh = settings.LOCAL_SEARCH_REFRESH
+        return self.built_at is None or time.monotonic() - self.built_at > refresh
+
+    def _ensure_built(self):
+        if not self._is_stale():
+            return
+        # keep serving the stale index while another thread rebuilds it,
+        # only wait when there is nothing to serve yet
+        if not self._lock.acquire(blocking=self.built_at is None):
+            return
+        try:
+            if self._is_stale():
+                from apps.shop.models import Product
+
+                started = time.monotonic()
+                index = LocalIndex().updated(add=Product.objects.get_index_objects())
+                self.index = index
+                self.built_at = started
+        finally:
+            self._lock.release()
+
+    def _update(self, add=(), remove=()):
+        self._ensure_built()
+        with self._lock:
+            self.index = self.index.updated(add=add, remove=remove)
+
+    def search(self, query, offset=0, limit=20, filters=None):
+        self._ensure_built()
+        index = self.index
+        tokens = tokenize(query)
+        if not tokens:
+            return [], 0
+
+        scores = None
+        for i, token in enumerate(tokens):
+            matches = index.match(token, prefix=i == len(tokens) - 1)
+            if scores is None:
+                scores = dict(matches)
+            else:
+                # every word of the query has to match
+                scores = {id: s + matches[id] for id, s in scores.items() if id in matches}
+            if not scores:
+                return [], 0
+
+        if filters:
+            scores = {
+                id: s for id, s in scores.items()
+                if all(index.docs[id].get(k) == v for k, v in filters.items())
+            }
+
+        ranked = sorted(scores, key=lambda id: (-scores[id], index.docs[id]["name"]))
+        return ranked[offset:offset + limit], len(ranked)
+
+    def setup(self, searchable, filterable):
+        return None
+
+    def add_documents(self, docs):
+        self._update(add=list(docs))
+
+    def update_documents(self, docs):
+        self._update(add=list(docs))
+
+    def delete_documents(self, ids):
+        self._update(remove=list(ids))
+
+    def clear(self):
+        with self._lock:
+            self.index = LocalIndex()
+            self.built_at = time.monotonic()
+
+
+def get_search_backend(path=None):
+    """Return the (per process) instance of the backend named in settings."""
+    path = path or settings.SEARCH_BACKEND
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
 
-search_index = SearchIndex().get_index()
 
 # TODO: TEST, REMOVE LATER
 # Using the functions
 # search = SearchIndex(index="app")
 # print(search.get_index())
-
-
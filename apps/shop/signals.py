@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from apps.shop.business_logic import queue_for_index
+from apps.shop.cache import bump_catalog_cache
+from apps.shop.models import Category, Product, Review
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    # keep the stored values so an edited review can be moved in the summary
+    instance._previous_rating = None
+    if not instance._state.adding:
+        instance._previous_rating = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list("product_id", "rating")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def add_review_rating(sender, instance, created, **kwargs):
+    current = (instance.product_id, instance.rating)
+    if created:
+        Product.objects.adjust_rating_stats(*current, 1)
+        queue_for_index([instance.product_id])
+        return
+
+    previous = getattr(instance, "_previous_rating", None)
+    if previous and previous != current:
+        Product.objects.adjust_rating_stats(*previous, -1)
+        Product.objects.adjust_rating_stats(*current, 1)
+        queue_for_index({previous[0], instance.product_id})
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    Product.objects.adjust_rating_stats(instance.product_id, instance.rating, -1)
+    queue_for_index([instance.product_id])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    queue_for_index([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, created, **kwargs):
+    if created:
+        # a new category has no products yet but is listed on every page
+        transaction.on_commit(bump_catalog_cache)
+    else:
+        queue_for_index(instance.products.values_list("id", flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # products are detached with SET_NULL, which sends no signals of its own
+    queue_for_index(instance.products.values_list("id", flat=True))
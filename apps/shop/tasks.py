@@ -0,0 +1,51 @@
+import logging
+
+from celery import shared_task
+
+from apps.shop.recommender import Recommender
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refresh_recommendations():
+    """
+    Task to materialize the suggestion lists of every product and of
+    the most commonly viewed carts.
+    """
+    products, carts = Recommender().refresh_all()
+    logger.info("refreshed suggestions for %s products and %s carts", products, carts)
+    return {"products": products, "carts": carts}
+
+
+@shared_task
+def record_products_bought(product_ids):
+    """
+    Task to save the products of a paid order for product recommendations.
+    """
+    Recommender().add_purchases([product_ids])
+
+
+@shared_task
+def decay_recommendations():
+    """
+    Task to age the bought-together scores so recent purchases weigh more.
+    """
+    processed = Recommender().decay()
+    logger.info("decayed %s bought-together sets", processed)
+    return processed
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=30)
+def sync_search_index(self):
+    """
+    Task to push changed products from the search outbox to Meilisearch.
+    """
+    from apps.shop.business_logic import sync_index_outbox
+
+    try:
+        updated, deleted = sync_index_outbox()
+    except Exception as e:
+        raise self.retry(exc=e)
+    logger.info("search sync: %s updated, %s deleted", updated, deleted)
+    return {"updated": updated, "deleted": deleted}
@@ -0,0 +1,42 @@
+from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from apps.shop.cache import get_product_cards, set_product_cards
+
+register = template.Library()
+
+CARD_TEMPLATE = "shop/partials/product_card.html"
+
+
+def card_context(product, htmx=False):
+    return {
+        "product": product,
+        "htmx": htmx,
+        "url": product.get_absolute_url,
+        "avg_rating": product.avg_rating,
+        "rating_range": range(5),
+    }
+
+
+@register.simple_tag
+def product_cards(products, htmx=False):
+    """
+    Render the cards of a listing. Cards are cached per product and variant,
+    fetched with one get_many, and only the misses are rendered.
+    """
+    products = list(products)
+    variant = "htmx" if htmx else "link"
+    cached, keys = get_product_cards(products, variant)
+    missing = {}
+    cards = []
+    for product in products:
+        html = cached.get(product.pk)
+        if html is None:
+            html = missing[product.pk] = render_to_string(
+                CARD_TEMPLATE, card_context(product, htmx)
+            )
+        cards.append(html)
+    if missing:
+        set_product_cards(missing, keys)
+    return mark_safe("".join(cards))
@@ -1,11 +1,18 @@
-from django.test import TestCase
+from django.template import Context, Template
+from django.test import override_settings
+from meilisearch.errors import MeilisearchCommunicationError
 
 from django.urls import reverse
-from apps.common.utils import TestUtil
-from apps.shop.models import Wishlist
+from apps.common.utils import RedisTestCase, TestUtil
+from apps.shop.models import Product, Review, Wishlist
+from apps.shop.business_logic import bump_catalog_version
+from apps.shop.images import cropped_image_url, image_srcset, image_url
+from apps.shop.recommender import Recommender
 
+from unittest.mock import patch
 
-class HomeViewTest(TestCase):
+
+class HomeViewTest(RedisTestCase):
     def setUp(self):
         TestUtil.create_product_with_category()
         self.url = reverse("shop:home")
@@ -19,7 +26,7 @@ class HomeViewTest(TestCase):
         self.assertIn("categories", response.context)
 
 
-class ProductListViewTest(TestCase):
+class ProductListViewTest(RedisTestCase):
     def setUp(self):
         self.url = reverse("shop:products_list")
         TestUtil.create_product()
@@ -34,8 +41,71 @@ class ProductListViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn("products", response.context)
 
+    @patch("apps.shop.search_index.SearchIndex.get_index")
+    def test_search_is_paged_in_meilisearch(self, mock_get_index):
+        product = Product.objects.first()
+        mock_get_index.return_value.search.return_value = {
+            "hits": [{"id": str(product.id)}],
+            "estimatedTotalHits": 16,
+        }
+        with self.settings(SEARCH_BACKEND="apps.shop.search_index.MeilisearchBackend"):
+            response = self.client.get(
+                self.url, {"q": "laptop", "page": 2, "filter": "featured"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["products"]), [product])
+        self.assertEqual(response.context["paginator"].num_pages, 2)
+
+        query, params = mock_get_index.return_value.search.call_args.args
+        self.assertEqual(query, "laptop")
+        self.assertEqual(params["offset"], 15)
+        self.assertEqual(params["limit"], 15)
+        self.assertEqual(params["filter"], ["featured = true"])
+
+    @override_settings(
+        SEARCH_BACKEND="apps.shop.search_index.LocalSearchBackend",
+        LOCAL_SEARCH_REFRESH=0,
+    )
+    def test_search_with_local_backend(self):
+        for _ in range(15):
+            TestUtil.create_product()
+        Product.objects.filter(pk=Product.objects.first().pk).update(featured=True)
+
+        response = self.client.get(self.url, {"q": "lap", "page": 2})
+        self.assertEqual(len(response.context["products"]), 1)
+        self.assertEqual(response.context["paginator"].count, 16)
+
+        response = self.client.get(self.url, {"q": "laptop", "filter": "featured"})
+        self.assertEqual(response.context["paginator"].count, 1)
+
+        response = self.client.get(self.url, {"q": "phone"})
+        self.assertEqual(response.context["paginator"].count, 0)
+
+    @patch("apps.shop.search_index.SearchIndex.get_index")
+    @override_settings(LOCAL_SEARCH_REFRESH=0)
+    def test_search_falls_back_when_meilisearch_is_down(self, mock_get_index):
+        mock_get_index.return_value.search.side_effect = MeilisearchCommunicationError("down")
+        with self.settings(SEARCH_BACKEND="apps.shop.search_index.MeilisearchBackend"):
+            response = self.client.get(self.url, {"q": "laptop"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["paginator"].count, 1)
 
-class ProductDetailViewTest(TestCase):
+    @override_settings(
+        SEARCH_BACKEND="apps.shop.search_index.LocalSearchBackend",
+        LOCAL_SEARCH_REFRESH=0,
+    )
+    @patch("apps.shop.search_index.LocalSearchBackend.search", return_value=([], 0))
+    def test_search_results_are_cached(self, mock_search):
+        self.client.get(self.url, {"q": "Laptop"})
+        self.client.get(self.url, {"q": "  laptop "})
+        self.assertEqual(mock_search.call_count, 1)
+
+        bump_catalog_version()
+        self.client.get(self.url, {"q": "laptop"})
+        self.assertEqual(mock_search.call_count, 2)
+
+
+class ProductDetailViewTest(RedisTestCase):
     def setUp(self):
         self.product = TestUtil.create_product_with_category()
         self.url = reverse(
@@ -62,7 +132,7 @@ class ProductDetailViewTest(TestCase):
         self.assertEqual(response.status_code, 404)
 
 
-class WishlistViewTest(TestCase):
+class WishlistViewTest(RedisTestCase):
     def setUp(self):
         self.user = TestUtil.verified_user()
         self.product = TestUtil.create_product_with_category()
@@ -92,7 +162,7 @@ class WishlistViewTest(TestCase):
         self.assertFalse(wishlist.products.exists())
         
 
-class CategoriesViewTest(TestCase):
+class CategoriesViewTest(RedisTestCase):
     def setUp(self):
         self.category = TestUtil.create_category()
         self.product = TestUtil.create_product_with_category()
@@ -107,3 +177,205 @@ class CategoriesViewTest(TestCase):
         response = self.client.get(reverse("shop:category_products", args=[self.product.category.slug]))
         self.assertEqual(response.status_code, 200)
         self.assertTrue(self.category, response.context["category"])
+
+
+class ProductRatingSummaryTest(RedisTestCase):
+    def setUp(self):
+        self.product = TestUtil.create_product()
+        self.profile = TestUtil.verified_user().profile
+        self.other_profile = TestUtil.other_user().profile
+
+    def test_summary_tracks_review_changes(self):
+        review = Review.objects.create(
+            product=self.product, customer=self.profile, text="Nice", rating=5
+        )
+        Review.objects.create(
+            product=self.product, customer=self.other_profile, text="Ok", rating=2
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.num_of_reviews, 2)
+        self.assertEqual(self.product.avg_rating, 4)
+        self.assertEqual(self.product.rating_histogram[5], 1)
+
+        review.rating = 4
+        review.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_sum, 6)
+        self.assertEqual(self.product.rating_5, 0)
+        self.assertEqual(self.product.rating_4, 1)
+
+        review.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.num_of_reviews, 1)
+        self.assertEqual(self.product.avg_rating, 2)
+
+    def test_sync_rating_stats(self):
+        Review.objects.create(
+            product=self.product, customer=self.profile, text="Nice", rating=3
+        )
+        Product.objects.filter(pk=self.product.pk).update(rating_count=0, rating_sum=0)
+
+        self.assertEqual(Product.objects.sync_rating_stats(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.num_of_reviews, 1)
+        self.assertEqual(self.product.avg_rating, 3)
+        self.assertEqual(Product.objects.sync_rating_stats(), 0)
+
+    def test_with_rating_stats(self):
+        Review.objects.create(
+            product=self.product, customer=self.profile, text="Nice", rating=5
+        )
+        Review.objects.create(
+            product=self.product, customer=self.other_profile, text="Ok", rating=4
+        )
+        product = Product.objects.available().with_rating_stats().get(pk=self.product.pk)
+        self.assertEqual(product.review_count, 2)
+        self.assertEqual(product.num_of_reviews, 2)
+        self.assertEqual(product.avg_rating, round(4.5))
+
+
+class RecommenderTest(RedisTestCase):
+    def setUp(self):
+        self.recommender = Recommender()
+        self.products = [TestUtil.create_product() for _ in range(3)]
+
+    def test_precomputed_suggestions(self):
+        first, second, third = self.products
+        self.recommender.products_bought([first, second])
+        self.recommender.products_bought([first, second, third])
+
+        self.recommender.refresh_product_suggestions([str(first.id)])
+        self.assertEqual(
+            self.recommender.suggest_products_for([first], 2), [second, third]
+        )
+        self.assertEqual(
+            self.recommender.suggest_products_for([first, second], 2), [third]
+        )
+
+    def test_decay_and_cap(self):
+        first, second, third = self.products
+        self.recommender.products_bought([first, second])
+        self.recommender.products_bought([first, second])
+        self.recommender.products_bought([first, third])
+        key = self.recommender.get_product_key(first.id)
+
+        self.recommender.decay(factor=0.5, min_score=0.75)
+        self.assertEqual(self.recommender.r.zscore(key, str(second.id)), 1.0)
+        self.assertIsNone(self.recommender.r.zscore(key, str(third.id)))
+
+        with self.settings(RECOMMENDATIONS_MAX_RELATED=1):
+            self.recommender.products_bought([first, third])
+            self.recommender.products_bought([first, third])
+        self.assertEqual(self.recommender.r.zcard(key), 1)
+
+
+class SearchIndexSignalsTest(RedisTestCase):
+    @patch("apps.shop.business_logic.queue_products_for_index")
+    def test_changes_are_queued_for_index(self, mock_queue):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = TestUtil.create_product_with_category()
+        mock_queue.assert_called_with([product.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category = product.category
+            category.name = "Computers"
+            category.save()
+        mock_queue.assert_called_with([product.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(
+                product=product,
+                customer=TestUtil.verified_user().profile,
+                text="Nice",
+                rating=5,
+            )
+        mock_queue.assert_called_with([product.pk])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class CatalogPageCacheTest(RedisTestCase):
+    def setUp(self):
+        self.product = TestUtil.create_product_with_category()
+        self.url = reverse("shop:home")
+
+    def test_anonymous_pages_are_cached_until_the_catalog_changes(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("HX-Request", response["Vary"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Renamed product"
+            self.product.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, "Renamed product")
+
+    @override_settings(SEARCH_BACKEND="apps.shop.search_index.LocalSearchBackend")
+    def test_search_pages_are_not_cached(self):
+        url = reverse("shop:products_list")
+        self.client.get(url, {"q": "laptop"})
+        response = self.client.get(url, {"q": "laptop"})
+        self.assertIn("products", response.context)
+
+    def test_authenticated_pages_are_not_cached(self):
+        self.client.force_login(TestUtil.verified_user())
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertIn("products", response.context)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ProductCardCacheTest(RedisTestCase):
+    def setUp(self):
+        self.product = TestUtil.create_product_with_category()
+
+    def render_cards(self):
+        products = Product.objects.with_rating_stats().filter(pk=self.product.pk)
+        return Template(
+            "{% load shop_tags %}{% product_cards products %}"
+        ).render(Context({"products": products}))
+
+    def test_cards_are_cached_until_the_product_changes(self):
+        html = self.render_cards()
+        self.assertIn("Reviews (0)", html)
+
+        with patch("apps.shop.templatetags.shop_tags.render_to_string") as render:
+            self.assertEqual(self.render_cards(), html)
+        render.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(
+                product=self.product,
+                customer=TestUtil.verified_user().profile,
+                text="Nice",
+                rating=4,
+            )
+        self.assertIn("Reviews (1)", self.render_cards())
+
+
+class ProductImageUrlTest(RedisTestCase):
+    def setUp(self):
+        image_url.cache_clear()
+        image_srcset.cache_clear()
+        cropped_image_url.cache_clear()
+        self.product = Product.objects.get(pk=TestUtil.create_product().pk)
+
+    def test_urls_come_from_the_size_table(self):
+        self.assertIn("w_400", self.product.card_image_url)
+        self.assertIn("w_250", self.product.thumbnail_url)
+        self.assertEqual(self.product.get_cropped_image_url(), self.product.thumbnail_url)
+        srcset = self.product.card_image_srcset.split(", ")
+        self.assertEqual([entry.split()[1] for entry in srcset], ["200w", "400w", "600w"])
+
+    def test_urls_are_built_once(self):
+        url = self.product.card_image_url
+        cropped = self.product.get_cropped_image_url(100, 100)
+        with patch("apps.shop.images.CloudinaryImage") as image:
+            self.assertEqual(self.product.card_image_url, url)
+            self.assertEqual(self.product.get_cropped_image_url(100, 100), cropped)
+        image.assert_not_called()
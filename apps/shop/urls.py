@@ -8,6 +8,7 @@ app_name = "shop"
 urlpatterns = [
     path("", views.HomeView.as_view(), name="home"),
     path("products/", views.ProductListView.as_view(), name="products_list"),
+    path("products/search/stats/", views.search_stats, name="search_stats"),
     path(
         "products/<str:id>/<slug:slug>/",
         views.ProductDetailView.as_view(),
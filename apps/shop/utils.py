@@ -13,12 +13,22 @@ def sort_products(request, products):
     if filter_value and (filter_value == "featured" or filter_value == "flash_deals"):
         filter_data = {filter_value: True}
         products = products.filter(**filter_data)
+    category = request.GET.get("category")
+    if category:
+        products = products.filter(category__slug=category)
     return products
 
 
 def sort_filter_value(request, context):
     filter_value = request.GET.get("filter")
+    category = request.GET.get("category")
     context["filter_value"] = filter_value
+    context["category_value"] = category
+    post_param = ""
     if filter_value:
-        context["post_param"] = f"&filter={filter_value}"
+        post_param += f"&filter={filter_value}"
+    if category:
+        post_param += f"&category={category}"
+    if post_param:
+        context["post_param"] = post_param
     return context
\ No newline at end of file
@@ -6,10 +6,17 @@ from django.db.models.query import QuerySet
 from django.http import JsonResponse
 from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_http_methods
 
 from apps.common.validators import validate_uuid
-from apps.shop.search_index import search_index
+from apps.shop.cache import cache_catalog_page
+from apps.shop.business_logic import (
+    SearchResults,
+    build_search_filter,
+    search_cache_stats,
+)
 from apps.shop.forms import ReviewForm
 from apps.shop.recommender import Recommender
 from apps.shop.utils import sort_products, sort_filter_value
@@ -19,9 +26,10 @@ from apps.shop.models import Category, Product, Wishlist
 from apps.cart.forms import CartAddProductForm
 
 
+@method_decorator(cache_catalog_page, name="dispatch")
 class HomeView(View):
     def get(self, request):
-        products = Product.objects.available()[:6]
+        products = Product.objects.available().with_rating_stats()[:6]
         categories = Category.objects.all()
         context = {
             "products": products,
@@ -30,6 +38,7 @@ class HomeView(View):
         return render(request, "shop/home.html", context)
 
 
+@method_decorator(cache_catalog_page, name="dispatch")
 class ProductListView(ListView):
     model = Product
     paginate_by = 15
@@ -37,14 +46,23 @@ class ProductListView(ListView):
     context_object_name = "products"
 
     def get_queryset(self) -> QuerySet[Product]:
-        products = Product.objects.available().prefetch_related("reviews")
+        products = Product.objects.available().with_rating_stats()
 
         # Handle search query
         query = self.request.GET.get("q")
 
         if query:
-            results = search_index.search(query=query)
-            return results.get("hits", [])  # returns matching result or empty list
+            # paging and filtering happen in meilisearch, only one page is fetched
+            try:
+                page = max(int(self.request.GET.get("page", 1)), 1)
+            except ValueError:
+                page = 1
+            filters = build_search_filter(
+                self.request.GET.get("filter"), self.request.GET.get("category")
+            )
+            return SearchResults(
+                query, products, page=page, per_page=self.paginate_by, filters=filters
+            )
 
         products = sort_products(self.request, products)
         return products
@@ -141,19 +159,21 @@ class ProductDetailView(View):
         return JsonResponse(response_data)
 
 
+@method_decorator(cache_catalog_page, name="dispatch")
 class CategoriesView(ListView):
     model = Category
     template_name = "shop/categories.html"
     context_object_name = "categories"
 
 
+@method_decorator(cache_catalog_page, name="dispatch")
 class CategoryProductsView(View):
     def get(self, request, *args, **kwargs):
         category = get_object_or_404(Category, slug=kwargs["slug"])
         products = (
             Product.objects.available()
             .filter(category=category)
-            .prefetch_related("reviews")
+            .with_rating_stats()
         )
         products = sort_products(self.request, products)
 
@@ -203,6 +223,11 @@ def remove_from_wishlist(request, product_id):
         return redirect("shop:view_wishlist")
 
 
+@staff_member_required
+def search_stats(request):
+    return JsonResponse(search_cache_stats())
+
+
 # TODO: DO FOR CART
 
 # TODO: FOR TEST, REMOVE LATER
@@ -190,18 +190,48 @@ STORAGES = {
         # "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
         "BACKEND": "whitenoise.storage.CompressedStaticFilesStorage",
     },
+    # generated invoices are private, keep them off the public media storage
+    "invoices": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {
+            "location": config(
+                "INVOICE_STORAGE_DIR", default=os.path.join(BASE_DIR, "invoices")
+            )
+        },
+    },
 }
 
-# CACHES = {
-#     "default": {
-#         "BACKEND": "django.core.cache.backends.redis.RedisCache",
-#         "LOCATION": "redis://127.0.0.1:6379/1",
-#     }
-# }
-
-REDIS_HOST = "localhost"
+REDIS_HOST = config("REDIS_HOST", default="localhost")
 REDIS_PORT = 6379
 REDIS_DB = 1
+# emptied around every RedisTestCase by apps.common.test_runner.RedisTestRunner
+REDIS_TEST_DB = config("REDIS_TEST_DB", default=15, cast=int)
+TEST_RUNNER = "apps.common.test_runner.RedisTestRunner"
+# shared connection pool used by the cart, recommender and celery (apps.common.redis_client)
+REDIS_MAX_CONNECTIONS = config("REDIS_MAX_CONNECTIONS", default=20, cast=int)
+REDIS_POOL_TIMEOUT = 5  # seconds to wait for a free pooled connection
+REDIS_SOCKET_TIMEOUT = 2
+
+CACHES = {
+    "default": {
+        # django's RedisCache on the shared pool, LOCATION is informational
+        "BACKEND": "apps.common.cache.PooledRedisCache",
+        "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}",
+        "KEY_PREFIX": "clothing_store",
+    }
+}
+
+CATALOG_CACHE_TIMEOUT = 60 * 5  # anonymous catalog pages, see apps.shop.cache
+PRODUCT_CARD_CACHE_TIMEOUT = 60 * 60 * 24  # cards are versioned, this only bounds memory
+
+CART_GUEST_TTL = 60 * 60 * 24 * 7  # guest carts expire after a week of inactivity
+
+CELERY_BROKER_POOL_LIMIT = REDIS_MAX_CONNECTIONS
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "max_connections": REDIS_MAX_CONNECTIONS,
+    "socket_timeout": REDIS_SOCKET_TIMEOUT,
+    "socket_connect_timeout": REDIS_SOCKET_TIMEOUT,
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -223,18 +253,63 @@ DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL")
 
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# apps.common.emails outbox
+EMAIL_BATCH_DELAY = 2  # seconds to gather mails into one SMTP session
+EMAIL_BATCH_SIZE = 50
+EMAIL_MAX_ATTEMPTS = 5  # failed sends before a mail is moved to the dead letter list
+
 EMAIL_OTP_EXPIRE_MINUTES = 15
 
 CELERY_BEAT_SCHEDULE = {
     "cancel-expired-orders": {
         "task": "apps.orders.tasks.cancel_expired_orders",
-        "schedule": crontab(hour=0, minute=0),  # Every day at midnight
-        # 'schedule': 1,
+        "schedule": crontab(minute="*/10"),
+    },
+    "release-expired-stock": {
+        "task": "apps.orders.tasks.release_expired_stock",
+        "schedule": crontab(),  # Every minute
+    },
+    "refresh-recommendations": {
+        "task": "apps.shop.tasks.refresh_recommendations",
+        "schedule": crontab(minute="*/15"),
+    },
+    "decay-recommendations": {
+        "task": "apps.shop.tasks.decay_recommendations",
+        "schedule": crontab(hour=3, minute=0, day_of_week=1),  # Every Monday
     },
 }
 
+# Precomputed "bought together" suggestions (apps.shop.recommender)
+RECOMMENDATIONS_SIZE = 12  # top-N stored per product / cart
+RECOMMENDATIONS_TTL = 60 * 60  # upper bound on how stale a suggestion list can be
+RECOMMENDATIONS_CART_SIGNATURES = 500  # most viewed carts kept precomputed
+RECOMMENDATIONS_MAX_RELATED = 200  # cap on products kept per bought-together set
+RECOMMENDATIONS_DECAY_FACTOR = 0.5  # weekly: a purchase counts half as much each week
+RECOMMENDATIONS_MIN_SCORE = 0.1  # decayed scores below this are dropped
+
 FIRST_PURCHASE_DISCOUNT = 10
 
+STOCK_HOLD_MINUTES = 30  # how long placed, unpaid orders keep their stock
+ORDER_PAYMENT_WINDOW_HOURS = 24  # unpaid orders older than this are canceled
+ORDER_EXPIRY_BATCH_SIZE = 500
+INVOICE_EXPORT_CHUNK_SIZE = 25  # invoices rendered per task of a bulk export
+INVOICE_EXPORT_TTL = 60 * 60  # how long an export can be followed and downloaded
+INVOICE_EXPORT_DEADLINE = 15 * 60  # invoices still missing after this count as failed
+
+# Product search (apps.shop.search_index)
+SEARCH_BACKEND = config(
+    "SEARCH_BACKEND", default="apps.shop.search_index.MeilisearchBackend"
+)
+# used when SEARCH_BACKEND is unreachable, set to None to raise instead
+SEARCH_FALLBACK_BACKEND = "apps.shop.search_index.LocalSearchBackend"
+LOCAL_SEARCH_REFRESH = 300  # seconds before the in-process index is rebuilt
+
+# Meilisearch indexing (apps.shop.business_logic)
+MEILISEARCH_BATCH_SIZE = 1000  # documents per add_documents request
+MEILISEARCH_TASK_TIMEOUT_MS = 60 * 1000
+SEARCH_SYNC_DELAY = 5  # seconds of product changes batched into one index sync
+SEARCH_CACHE_TTL = 60  # seconds a search results page is reused
+
 JAZZMIN_SETTINGS = {
     # title of the window (Will default to current_admin_site.site_title if absent or None)
     "site_title": "Sixteen Clothing Store Admin",
@@ -14,6 +14,7 @@ urlpatterns = [
     path("orders/", include("apps.orders.urls", namespace="orders")),
     path("payments/", include("apps.payments.urls", namespace="payments")),
     path("coupons/", include("apps.coupons.urls", namespace="coupons")),
+    path("", include("apps.common.urls", namespace="common")),
 ]
 
 if settings.DEBUG: